@@ -1,168 +1,59 @@
 import os
-import shutil
 import datetime
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from eumdac import DataStore, AccessToken
-from pyresample import create_area_def
+import dask
 from satpy import Scene
 from dateutil.relativedelta import relativedelta
-import cv2
-from pyproj import Transformer
 import gc
-from skyfield.api import load, wgs84
+from EumetSat_utils import mask_night, get_area, REGION_EXTENTS, get_resampler_cache, fetch_entry, run_pipeline, PIPELINE_MODES, handle_color, init_process_worker, group_targets_by_area, ProductRangeSource, download_native_subset, low_memory_dask_config, crop_to_areas, record_failure, report_failures
+from EumetSat_storage import get_output_store
+from EumetSat_options import MSG_RESOLUTIONS
+from EumetSat_base import EumetSatBase
 from shapely.wkt import loads
 from shapely.geometry import Polygon
 import warnings
 import time
 warnings.filterwarnings('ignore')
 
-class EumetSatMSG:
-    def __init__(self, consumer_key=None, consumer_secret=None):
-        if not consumer_key or not consumer_secret:
-            raise Exception("Consumer key and secret are required.")
-        self.last_picture = False
-        self.credentials = (consumer_key, consumer_secret)
-        self.token = AccessToken(self.credentials)
-        self.datastore = DataStore(self.token)
-        self.selected_collection = self.datastore.get_collection('EO:EUM:DAT:MSG:MSG15-RSS')
-        self.resolution = {
-            'HRV': 1000,
-            'IR_016': 3000,
-            'IR_039': 3000,
-            'IR_087': 3000,
-            'IR_097': 3000,
-            'IR_108': 3000,
-            'IR_120': 3000,
-            'IR_134': 3000,
-            'VIS006': 3000,
-            'VIS008': 3000,
-            'WV_062': 3000,
-            'WV_073': 3000
-        }
-
-        composite_map = {
-            '24h_microphysics': 3000,
-            'airmass': 3000,
-            'ash': 3000,
-            'cloud_phase_distinction': 3000,
-            'cloud_phase_distinction_raw': 3000,
-            'cloudtop': 3000,
-            'cloudtop_daytime': 3000,
-            'colorized_ir_clouds': 3000,
-            'convection': 3000,
-            'day_microphysics': 3000,
-            'day_microphysics_winter': 3000,
-            'day_severe_storms': 3000,
-            'day_severe_storms_tropical': 3000,
-            'dust': 3000,
-            'fog': 3000,
-            'green_snow': 3000,
-            'hrv_clouds': 1000,
-            'hrv_fog': 1000,
-            'hrv_severe_storms': 1000,
-            'hrv_severe_storms_masked': 1000,
-            'ir108_3d': 3000,
-            'ir_cloud_day': 3000,
-            'ir_overview': 3000,
-            'ir_sandwich': 3000,
-            'natural_color': 3000,
-            'natural_color_nocorr': 3000,
-            'natural_color_raw': 3000,
-            'natural_color_raw_with_night_ir': 3000,
-            'natural_color_with_night_ir': 3000,
-            'natural_color_with_night_ir_hires': 3000,
-            'natural_enh': 3000,
-            'natural_enh_with_night_ir': 3000,
-            'natural_enh_with_night_ir_hires': 3000,
-            'natural_with_night_fog': 3000,
-            'night_fog': 3000,
-            'night_ir_alpha': 3000,
-            'night_ir_with_background': 3000,
-            'night_ir_with_background_hires': 3000,
-            'night_microphysics': 3000,
-            'night_microphysics_tropical': 3000,
-            'overshooting_tops': 3000,
-            'overview': 3000,
-            'overview_raw': 3000,
-            'realistic_colors': 3000,
-            'rocket_plume_day': 3000,
-            'rocket_plume_night': 3000,
-            'snow': 3000,
-            'vis_sharpened_ir': 3000
-        }
-
-        self.resolution.update(composite_map)
-
-    def _get_sun_elevation(self, dt_utc, lat=39.6, lon=2.9):
-        ts = load.timescale()
-        t = ts.utc(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute)
-        eph = load('de421.bsp')
-        sun = eph['sun']
-        earth = eph['earth']
-        location = earth + wgs84.latlon(latitude_degrees=lat, longitude_degrees=lon)
-        astrometric = location.at(t).observe(sun)
-        alt, _, _ = astrometric.apparent().altaz()
-        return alt.degrees
-
-    def handle_color(self, img, qmin=1, qmax=99, enhance = True):
-        if img.ndim == 3 and img.shape[-1] == 3:
-            if np.allclose(img[...,0], img[...,1]) and np.allclose(img[...,1], img[...,2]):
-                img = img[...,0] 
-        if enhance:
-            data = np.nan_to_num(img, nan=0.0)
-            if data.ndim == 2:  # grayscale
-                vmin, vmax = np.percentile(data, (qmin, qmax))
-                scaled = np.clip((data - vmin) / (vmax - vmin), 0, 1)
-                return (255 * scaled).astype(np.uint8)
-
-            elif data.ndim == 3 and data.shape[-1] == 3:  # RGB
-                out = np.zeros_like(data, dtype=np.uint8)
-                for i in range(3):
-                    vmin, vmax = np.percentile(data[..., i], (qmin, qmax))
-                    scaled = np.clip((data[..., i] - vmin) / (vmax - vmin), 0, 1)
-                    out[..., i] = (255 * scaled).astype(np.uint8)
-                return out
-        else:
-            return img
-
-    def _compute_pixel_dimensions(self, area_extent, meters_per_pixel=500):
-        lon_min, lat_min, lon_max, lat_max = area_extent
-        transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-        x_min, y_min = transformer.transform(lon_min, lat_min)
-        x_max, y_max = transformer.transform(lon_max, lat_max)
-        width_px = int(abs(x_max - x_min) / meters_per_pixel)
-        height_px = int(abs(y_max - y_min) / meters_per_pixel)
-        return width_px, height_px
-    
-    def _create_area(self, name, area_extent, channel):
-        xpix, ypix = self._compute_pixel_dimensions(area_extent, meters_per_pixel = self.resolution[channel])
-        return create_area_def(name, {'proj': 'latlong', 'datum': 'WGS84'}, width=xpix, height=ypix, area_extent=area_extent)
-
-    def _define_area(self, country, lat_min, lat_max, lon_min, lon_max, channel):
-                
-        area_defs = {
-            'balearic_islands': self._create_area('balearic_islands', [1.0, 38.5, 4.5, 40.27], channel),
-            'iberia': self._create_area('iberia', [-10.0, 35.0, 4.5, 44.5], channel),
-            'france': self._create_area('france', [-5.5, 41.0, 9.5, 51.5], channel),
-            'uk_ireland': self._create_area('uk_ireland', [-11.0, 49.5, 3.5, 60.0], channel),
-            'germany_benelux': self._create_area('germany_benelux', [2.5, 47.0, 14.5, 55.0], channel),
-            'scandinavia': self._create_area('scandinavia', [5.0, 55.0, 25.0, 71.5], channel),
-            'italy': self._create_area('italy', [6.0, 36.0, 19.0, 47.0], channel),
-            'greece':self._create_area('greece', [19.0, 34.5, 29.5, 42.5], channel),
-            'balkans':self._create_area('balkans', [13.0, 36.0, 30.0, 47.5], channel)
-        }
-
-        countries_dict = {'iberia':area_defs['iberia'],
-                        'balearic_islands':area_defs['balearic_islands'],
-                        'france':area_defs['france'],
-                        'uk_ireland':area_defs['uk_ireland'],
-                        'germany_benelux':area_defs['germany_benelux'],
-                        'scandinavia':area_defs['scandinavia'],
-                        'italy':area_defs['italy'],
-                        'greece':area_defs['greece'],
-                        'balkans':area_defs['balkans']}
-
-        
+# ========== TIMESTEP PROCESSING ==========
+# Module level so it can run in a ProcessPoolExecutor worker: everything it needs
+# travels in the params dict and the area definition / resampler are taken from
+# the registries of the process running it.
+
+def process_msg_timestep(files, ts_dt, targets, params):
+    # All the channels are loaded from one Scene, which is then cropped to the footprint
+    # of each target area and resampled once per area
+    scn = Scene(filenames=files, reader='seviri_l1b_native')
+    scn.load(list(dict.fromkeys(target['channel'] for target in targets)))
+    resampler_cache = get_resampler_cache(params['resampler_cache_dir'])
+    images = []
+    for area_spec, area_targets in group_targets_by_area(targets, key='area_spec'):
+        area_def = get_area(*area_spec)
+        area_scn = crop_to_areas(scn, [area_def]) if params['crop'] else scn
+        scn_resampled = resampler_cache.resample(area_scn, area_def, datasets=[target['channel'] for target in area_targets])
+        for target in area_targets:
+            img = scn_resampled[target['channel']].values
+            if img.ndim == 3 and img.shape[0] == 3:
+                img = np.moveaxis(img, 0, -1)
+            if params['mask_night_pixels'] and params['skip_night_angle']:
+                img = mask_night(img, area_def, ts_dt, params['skip_night_angle'])
+            # The running stretch is applied in order when the timesteps are written
+            if not params['save_as_npy'] and not params['running_stretch']:
+                img = handle_color(img, enhance = params['enhance_img'])
+            images.append((target, img))
+    return images
+
+class EumetSatMSG(EumetSatBase):
+    satellite = 'MSG'
+    collection_id = 'EO:EUM:DAT:MSG:MSG15-RSS'
+    resolutions = MSG_RESOLUTIONS
+    default_channel = 'HRV'
+    default_poll_minutes = 5
+
+    def _area_spec(self, country, lat_min, lat_max, lon_min, lon_max, channel):
         use_custom_roi = all([
             lat_min is not None,
             lat_max is not None,
@@ -171,16 +62,13 @@ class EumetSatMSG:
         ])
 
         if use_custom_roi:
-            manual_extent = [lon_min, lat_min, lon_max, lat_max]
-            area_def_custom = self._create_area('custom_area', manual_extent, channel)
+            return ('custom_area', (lon_min, lat_min, lon_max, lat_max), self.resolution[channel])
+        if country not in REGION_EXTENTS:
+            raise ValueError(f"Invalid country: {country}. Choose from: {list(REGION_EXTENTS.keys())}")
+        return (country, tuple(REGION_EXTENTS[country]), self.resolution[channel])
 
-            area_def = area_def_custom
-        else:
-            if country not in countries_dict:
-                raise ValueError(f"Invalid country: {country}. Choose from: {list(countries_dict.keys())}")
-
-            area_def = countries_dict[country]
-        return area_def
+    def _define_area(self, country, lat_min, lat_max, lon_min, lon_max, channel):
+        return get_area(*self._area_spec(country, lat_min, lat_max, lon_min, lon_max, channel))
 
     def get_available_ids(self):
         print("Channel Name".ljust(35), "Resolution (m/px)")
@@ -188,25 +76,141 @@ class EumetSatMSG:
         for channel, res in sorted(self.resolution.items()):
             print(channel.ljust(35), res)
 
+    def _download_timestep(self, product, run):
+        for entry in product.entries:
+            local_filename = os.path.basename(entry)
+            if not local_filename.endswith('.nat'):
+                continue
+            try:
+                ts_str = local_filename.split('-')[5]  
+                ts_str = ts_str.split('.')[0]          
+                ts_dt = datetime.datetime.strptime(ts_str, "%Y%m%d%H%M%S")
+            except Exception as e:
+                print(f"Failed to parse timestamp from filename: {local_filename} ({e})")
+                continue
+
+            # Skip if we've already produced every output of this timestamp, any case
+            targets = [target for target in run['targets'] if not self._target_done(target, ts_dt, run)]
+            if not targets:
+                print(f"Outputs for {ts_dt.strftime('%Y%m%dT%H%M%S')} already exist. Skipping download.")
+                continue
+
+            print(f"Downloading: {local_filename} | UTC Time: {ts_dt.strftime('%Y-%m-%d %H:%M')}")
+            try:
+                if run['partial_download']:
+                    # Only the scan lines covering the target areas; not stored in the product cache
+                    local_filepath = download_native_subset(ProductRangeSource(product, entry), os.path.join(run['output_path'], local_filename), run['area_defs'], run['download_retries'])
+                else:
+                    local_filepath = fetch_entry(product, entry, os.path.join(run['output_path'], local_filename), run['download_retries'], self.product_cache)
+            except Exception as e:
+                print(f"Download failed for {entry}: {e}")
+                record_failure(run, ts_dt, 'download', e)
+                continue
+            print(f"Saved: {local_filename}")
+            return {'ts_dt': ts_dt, 'targets': targets, 'files': [local_filepath]}
+        return None
+
+    def _process_timestep(self, job, run):
+        try:
+            job['images'] = process_msg_timestep(job['files'], job['ts_dt'], job['targets'], run['process_params'])
+            return job
+        except Exception as e:
+            print(f"Error processing scene: {e}")
+            record_failure(run, job['ts_dt'], 'process', e)
+            self._remove_files(job['files'])
+            return None
+
+    def _collect_process_result(self, job, run):
+        try:
+            job['images'] = job.pop('future').result()
+        except Exception as e:
+            print(f"[WARN] Processing failed for {job['ts_dt'].strftime('%Y-%m-%d %H:%M')}: {e}")
+            record_failure(run, job['ts_dt'], 'process', e)
+            self._remove_files(job['files'])
+            return
+        self._write_timestep(job, run)
+
+    def _run_process_pool(self, products, run, workers, dask_config=None):
+        # Downloads stay in this process and feed the pool as they complete; results
+        # are written in timestep order, keeping at most 2 * workers timesteps on disk
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_process_worker, initargs=(dask_config,)) as pool:
+            for product in products:
+                job = self._download_timestep(product, run)
+                if job is None:
+                    continue
+                job['future'] = pool.submit(process_msg_timestep, job['files'], job['ts_dt'], job['targets'], run['process_params'])
+                pending.append(job)
+                while pending and (pending[0]['future'].done() or len(pending) > 2 * workers):
+                    self._collect_process_result(pending.popleft(), run)
+            while pending:
+                self._collect_process_result(pending.popleft(), run)
+
+    def _prepare_run(self, skip_night_angle=25, partial_download=False, **kwargs):
+        # A skip_night_angle of 0 keeps every timestep
+        run = super()._prepare_run(skip_night_angle=skip_night_angle or None, **kwargs)
+        run['partial_download'] = partial_download
+        run['process_params'] = {
+            'resampler_cache_dir': self.resampler_cache.cache_dir,
+            'skip_night_angle': run['skip_night_angle'],
+            'mask_night_pixels': run['mask_night_pixels'],
+            'save_as_npy': run['save_as_npy'],
+            'enhance_img': run['enhance_img'],
+            'running_stretch': run['stretch'] is not None,
+            'crop': run['crop']
+        }
+        return run
+
+    def _run_targets(self, run, channels):
+        return [{'channel': ch, 'region': region, 'area_spec': self._area_spec(region, run['lat_min'], run['lat_max'], run['lon_min'], run['lon_max'], ch)}
+                for region in run['regions'] for ch in channels]
+
+    def _target_area(self, target):
+        return get_area(*target['area_spec'])
+
+    def _downloader(self, run):
+        return contextlib.nullcontext(lambda product: self._download_timestep(product, run))
+
     def get_image(self,
                   start_date,
                   end_date,
                   output_path=None,
                   skip_night_angle=25,
-                  country='iberia',
+                  country=None,
                   channel='HRV',
                   lat_min=None,
                   lat_max=None,
                   lon_min=None,
                   lon_max=None,
                   save_as_npy = False,
-                  enhance_img = False):
+                  enhance_img = False,
+                  sun_sampling = 'center',
+                  mask_night_pixels = False,
+                  download_retries = 3,
+                  mode = 'sequential',
+                  queue_size = 2,
+                  process_workers = 1,
+                  workers = 1,
+                  partial_download = False,
+                  low_memory = False,
+                  memory_budget_mb = 2048,
+                  crop = True,
+                  output_format = None,
+                  stretch = 'frame',
+                  stretch_decay = 0.9):
         
         start = time.time()
-        if country is not None:
-            country = country.lower()
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Choose from: {list(PIPELINE_MODES)}")
+        run = self._prepare_run(output_path=output_path, skip_night_angle=skip_night_angle, country=country, channel=channel,
+                                lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max,
+                                save_as_npy=save_as_npy, enhance_img=enhance_img, sun_sampling=sun_sampling,
+                                mask_night_pixels=mask_night_pixels, download_retries=download_retries,
+                                partial_download=partial_download, low_memory=low_memory, crop=crop,
+                                output_format=output_format, stretch=stretch, stretch_decay=stretch_decay)
 
         try:
+            self.last_picture = False
             dtstart = datetime.datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%S")
             dtend = datetime.datetime.strptime(end_date, "%Y-%m-%dT%H:%M:%S")
         except:
@@ -214,101 +218,41 @@ class EumetSatMSG:
             dtstart = datetime.datetime.now(datetime.timezone.utc) - relativedelta(minutes=15)
             dtend = datetime.datetime.now(datetime.timezone.utc)
 
-        output_path = output_path or os.path.join(os.getcwd(), 'imgs')
-        os.makedirs(output_path, exist_ok=True)
-
-        products = self.selected_collection.search(dtstart=dtstart, dtend=dtend)
-        print(f"Found {len(products)} matching timestep(s).")
-        existing_stems = {os.path.splitext(f)[0].lower() for f in os.listdir(output_path)}
-
-        # If no start datetime is provided, retrieve the most recent product available
-        for i, product in enumerate(products):
-            if self.last_picture and i > 0:
-                continue
-            for entry in product.entries:
-                try:
-                    local_filename = os.path.basename(entry)
-                    if not local_filename.endswith('.nat'):
+        products = self._search_products(dtstart, dtend, run)
+        run['store'] = get_output_store(run['output_format'], run['output_path'], 'MSG', capacity=len(products))
+
+        # The memory budget is shared by the timesteps processed concurrently; pool
+        # workers run dask synchronously, one chunk at a time
+        dask_config = {}
+        if low_memory:
+            concurrent = workers if workers > 1 else (process_workers if mode == 'pipeline' else 1)
+            dask_config = low_memory_dask_config(memory_budget_mb / concurrent, num_workers=1 if workers > 1 else None)
+
+        with dask.config.set(dask_config):
+            if workers > 1:
+                self._run_process_pool(products, run, workers, dask_config)
+            elif mode == 'pipeline':
+                run_pipeline(products,
+                             lambda product: self._download_timestep(product, run),
+                             lambda job: self._process_timestep(job, run),
+                             lambda job: self._write_timestep(job, run),
+                             queue_size=queue_size,
+                             process_workers=process_workers)
+            else:
+                for product in products:
+                    job = self._download_timestep(product, run)
+                    if job is None:
                         continue
-                    try:
-                        ts_str = local_filename.split('-')[5]  
-                        ts_str = ts_str.split('.')[0]          
-                        ts_dt = datetime.datetime.strptime(ts_str, "%Y%m%d%H%M%S")
-                    except Exception as e:
-                        print(f"Failed to parse timestamp from filename: {local_filename} ({e})")
+                    job = self._process_timestep(job, run)
+                    if job is None:
                         continue
+                    self._write_timestep(job, run)
 
-                    effective_channel = (channel or 'HRV')          # always a string
-                    channel_norm = effective_channel.lower()   
-
-                    base_name = f"{channel_norm}_{ts_dt.strftime('%Y%m%dT%H%M%S')}" 
-
-                    # Skip if we've already produced this timestamp (either .jpg or .npy), any case
-                    if base_name.lower() in existing_stems:
-                        print(f"{base_name} already exists. Skipping download.")
-                        continue
-
-                    # === SKIP IF THE SUN ANGLE IS BELOW A CERTAIN THRESHOLD ===
-                    if skip_night_angle:
-                        sun_elev = self._get_sun_elevation(ts_dt)
-                        print(f"Sun elevation at {ts_dt} UTC: {sun_elev:.2f}°")
-                        if sun_elev < skip_night_angle: # 25º as threshold
-                            print("Skipping due to low sun angle.")
-                            continue
-
-                    with product.open(entry=entry) as fsrc:
-
-                        print(f"Downloading: {local_filename} | UTC Time: {ts_dt.strftime('%Y-%m-%d %H:%M')}")
-                        local_filepath = os.path.join(output_path, local_filename)
-                        with open(local_filepath, 'wb') as fdst:
-                            shutil.copyfileobj(fsrc, fdst)
-                        print(f"Saved: {local_filename}")
-                        try:
-                            scn = Scene(filenames=[local_filepath], reader='seviri_l1b_native')
-                            # print(scn.available_composite_ids())
-                            scn.load([effective_channel])
-                            area_def = self._define_area(country, lat_min, lat_max, lon_min, lon_max, channel)
-                            scn_resampled = scn.resample(area_def)
-                            img = scn_resampled[effective_channel].values
-                            if img.ndim == 3 and img.shape[0] == 3:
-                                img = np.moveaxis(img, 0, -1)
-            
-                            if save_as_npy:
-                                ts_str = ts_dt.strftime('%Y%m%dT%H%M%S')
-                                base_name = f"{channel_norm.lower()}_{ts_str}"
-                                npy_path = os.path.join(output_path, f"{base_name}.npy")
-                                np.save(npy_path, img)
-                                print(f'Saved at {output_path}')
-                                print(f"Saved array: {os.path.basename(npy_path)}  shape={img.shape} dtype={img.dtype}")
-                                # print(f'Just to see the saved file: {img} ')
-
-                            else:
-                                img = self.handle_color(img, enhance = enhance_img)
-                                if any(v is None for v in [lon_min, lon_max, lat_min, lat_max]) and country is not None:
-                                    img_name = f"MSG_{channel}_{country}_{ts_dt.strftime('%Y%m%dT%H%M%S')}.jpg"
-                                elif any(v is not None for v in [lon_min, lon_max, lat_min, lat_max]) and country is None:
-                                    img_name = f"MSG_{channel}_LON{lon_min}S{lon_max}_LAT{lat_min}S{lat_max}_{ts_dt.strftime('%Y%m%dT%H%M%S')}.jpg"
-                                else:
-                                    raise Exception('Mixture of predefined country and customs areas found. Pick one please.')
-                                cv2.imwrite(os.path.join(output_path, img_name), img)
-                                print(f'Saved at {output_path}')
-                                print(f"Saved image: {img_name}")
-                            existing_stems.add(base_name)
-                            os.remove(local_filepath)
-
-                        except Exception as e:
-                            print(f"Error processing scene: {e}")
-
-                        print('====================================================')
-
-                except Exception as e:
-                    print(f"Download failed for {entry}: {e}")
-
-                finally:
-                    elapsed = time.time() - start
+        report_failures(run['failures'])
         end = time.time()
         elapsed = end - start
         print(f'Ended execution at: {datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")}. It took {elapsed:.2f} seconds.')
+        return run['failures']
 
 # ========== MAIN ==========
 
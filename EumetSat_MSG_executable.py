@@ -1,382 +1,183 @@
-import os
-import shutil
 import datetime
-from eumdac import DataStore, AccessToken
-from pyresample import create_area_def
-from satpy import Scene
-from dateutil.relativedelta import relativedelta
-import cv2
-from shapely.geometry import Polygon
-from pyproj import Transformer
-from skyfield.api import load, wgs84
-import warnings
-import time
-import numpy as np
 import argparse
+import warnings
+import functools
+from EumetSat_options import SUN_SAMPLINGS, PIPELINE_MODES, STRETCH_MODES, OUTPUT_FORMATS, MSG_RESOLUTIONS, CADENCE_MINUTES, print_channels, print_regions, plan_run, print_plan
 warnings.filterwarnings('ignore')
-print(f'Started execution at: {datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")}')
-start = time.time()
-print("===========================================")
-print("================ EUMETSAT MSG ================")
-print("===========================================")
-
-print(r""" 
-                                                      
-                                                      
-       *+.                                            
-      -=-+*=                                          
-      =::::-=+=                                       
-     ----:::.--+*=                                    
-    ==::.::::::.--=*-              +**+-              
-    -**=--..::::: .-+##-          --:::==-            
-        **=-::.:..--::=#%       @+.:.                 
-           +*=-.  -*++-+   *@*@@@       .@@*          
-              ++#@%*=*@@ @@@@+%%@   .@-    .          
-                 @@@@@@%+@@-:*#@@@      : .-:         
-                    =+:*-%:-#% .@@@   :. ..:          
-                    -@@==+*@ -@-.@@@%                 
-                     @@@@@@%@+@@%*- :+***#%+          
-                          =      :..------=#%@+       
-                                =##*=-:------+%@@-    
-                                   -###+---===-*#     
-                                      :#%%#---+@=     
-                                          %@@%*@      
-                                            .@@@      
-                                                                                                                                                                                                                                                                                                          
-""")
-
-parser = argparse.ArgumentParser(description="Download and process EUMETSAT satellite data.")
-parser.add_argument('--start_date', type=str, help="Start date in format YYYY-MM-DDTHH:MM:SS")
-parser.add_argument('--output_path', type = str, help="Folder where to save the images")
-parser.add_argument('--end_date', type=str, help="End date in format YYYY-MM-DDTHH:MM:SS")
-parser.add_argument('--skip_night_angle', type = int, default = 25)
-parser.add_argument('--channel', type = str, help = 'Spectral band')
-parser.add_argument('--lat_min', type=float, help="Minimum latitude for custom region", default = None)
-parser.add_argument('--lat_max', type=float, help="Maximum latitude for custom region", default = None)
-parser.add_argument('--lon_min', type=float, help="Minimum longitude for custom region", default = None)
-parser.add_argument('--lon_max', type=float, help="Maximum longitude for custom region", default = None)
-parser.add_argument('--consumer_key', type = str, help = 'Your Consumer Key of your EumetSat account')
-parser.add_argument('--consumer_secret', type = str, help = 'Your Consumer Secret of your EumetSat account')
-parser.add_argument('--save_as_npy', action = 'store_true', help = 'Save your file as a .npy file')
-parser.add_argument('--country', type = str, help = 'Predefined area of country of interest', default = 'iberia')
-parser.add_argument('--enhance_img', action = 'store_true', help = 'Enables improving the contrast of the image')
-
-args = parser.parse_args()
-try:
-    last_product = False
-    dtstart = datetime.datetime.strptime(args.start_date, "%Y-%m-%dT%H:%M:%S")
-    dtend = datetime.datetime.strptime(args.end_date, "%Y-%m-%dT%H:%M:%S")
-except:
-    last_product = True
-    dtstart = datetime.datetime.now(datetime.timezone.utc) - relativedelta(minutes=15)
-    dtend = datetime.datetime.now(datetime.timezone.utc)
-
-channel = args.channel if args.channel is not None else 'HRV'
 
-# ========== FLAGS ==========
-skip_night_angle = args.skip_night_angle
-
-output_path = args.output_path if args.output_path is not None else os.path.join(os.getcwd(), 'imgs')
-os.makedirs(output_path, exist_ok = True)
-
-# ========== HANDLE COLOR CONTRAST ==========
-def handle_color(img, qmin=1, qmax=99, enhance = True):
-    if img.ndim == 3 and img.shape[-1] == 3:
-        if np.allclose(img[...,0], img[...,1]) and np.allclose(img[...,1], img[...,2]):
-            img = img[...,0] 
-    if enhance:
-        data = np.nan_to_num(img, nan=0.0)
-        if data.ndim == 2:  # grayscale
-            vmin, vmax = np.percentile(data, (qmin, qmax))
-            scaled = np.clip((data - vmin) / (vmax - vmin), 0, 1)
-            return (255 * scaled).astype(np.uint8)
-
-        elif data.ndim == 3 and data.shape[-1] == 3:  # RGB
-            out = np.zeros_like(data, dtype=np.uint8)
-            for i in range(3):
-                vmin, vmax = np.percentile(data[..., i], (qmin, qmax))
-                scaled = np.clip((data[..., i] - vmin) / (vmax - vmin), 0, 1)
-                out[..., i] = (255 * scaled).astype(np.uint8)
-            return out
+# ========== INPUT PARAMETERS ==========
+# Parsing, validation, --list_channels/--list_regions and --dry_run only need the
+# standard library; satpy, pyresample, cv2, skyfield, shapely and eumdac are only
+# imported once a run starts (see benchmarks/bench_cli_startup.py)
+
+BANNER = r""" 
+                                                  
+                                                  
+   *+.                                            
+  -=-+*=                                          
+  =::::-=+=                                       
+ ----:::.--+*=                                    
+==::.::::::.--=*-              +**+-              
+-**=--..::::: .-+##-          --:::==-            
+    **=-::.:..--::=#%       @+.:.                 
+       +*=-.  -*++-+   *@*@@@       .@@*          
+          ++#@%*=*@@ @@@@+%%@   .@-    .          
+             @@@@@@%+@@-:*#@@@      : .-:         
+                =+:*-%:-#% .@@@   :. ..:          
+                -@@==+*@ -@-.@@@%                 
+                 @@@@@@%@+@@%*- :+***#%+          
+                      =      :..------=#%@+       
+                            =##*=-:------+%@@-    
+                               -###+---===-*#     
+                                  :#%%#---+@=     
+                                      %@@%*@      
+                                        .@@@      
+                                                                                                                                                                                                                                                                                                      
+"""
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download and process EUMETSAT satellite data.")
+    parser.add_argument('--start_date', type=str, help="Start date in format YYYY-MM-DDTHH:MM:SS")
+    parser.add_argument('--output_path', type = str, help="Folder where to save the images")
+    parser.add_argument('--end_date', type=str, help="End date in format YYYY-MM-DDTHH:MM:SS")
+    parser.add_argument('--skip_night_angle', type = int, default = 25)
+    parser.add_argument('--channel', type = str, nargs = '+', help = 'Spectral band(s) or composite(s); several are produced from the same download')
+    parser.add_argument('--lat_min', type=float, help="Minimum latitude for custom region", default = None)
+    parser.add_argument('--lat_max', type=float, help="Maximum latitude for custom region", default = None)
+    parser.add_argument('--lon_min', type=float, help="Minimum longitude for custom region", default = None)
+    parser.add_argument('--lon_max', type=float, help="Maximum longitude for custom region", default = None)
+    parser.add_argument('--consumer_key', type = str, help = 'Your Consumer Key of your EumetSat account')
+    parser.add_argument('--consumer_secret', type = str, help = 'Your Consumer Secret of your EumetSat account')
+    parser.add_argument('--save_as_npy', action = 'store_true', help = 'Save your file as a .npy file')
+    parser.add_argument('--output_format', type = str, choices = OUTPUT_FORMATS, default = None, help = 'jpg, npy, zarr (raw frames appended to one chunked datacube per channel and region) or memmap (one preallocated memory-mappable .npy plus an .index.npy per channel and region); defaults to npy with --save_as_npy, jpg otherwise')
+    parser.add_argument('--country', type = str, nargs = '+', help = 'Predefined area(s) of country of interest (iberia when no custom bounds are given)', default = None)
+    parser.add_argument('--enhance_img', action = 'store_true', help = 'Enables improving the contrast of the image')
+    parser.add_argument('--stretch', type = str, choices = STRETCH_MODES, default = 'frame', help = 'frame: stretch every image between its own 1/99 percentiles. running: use percentiles tracked across the time series, so sequences keep a consistent brightness (with --enhance_img)')
+    parser.add_argument('--stretch_decay', type = float, default = 0.9, help = 'Weight kept by the running percentile histogram at each new image (running stretch)')
+
+    parser.add_argument('--ephemeris_path', type = str, help = 'Local de421.bsp file (or folder holding it) used for the sun elevation, to run offline', default = None)
+    parser.add_argument('--sun_sampling', type = str, choices = SUN_SAMPLINGS, default = 'center', help = 'Where the sun elevation is evaluated over the selected area (center, corners or pixels); a scene is kept if any sampled point is above skip_night_angle')
+    parser.add_argument('--mask_night_pixels', action = 'store_true', help = 'Blank out the pixels where the sun is below skip_night_angle instead of keeping the whole lit scene')
+    parser.add_argument('--resampler_cache_dir', type = str, help = 'Folder where the resampling lookup tables are cached and reused across runs', default = None)
+    parser.add_argument('--product_cache_dir', type = str, help = 'Folder where the raw downloaded products are kept and reused across channels, regions and runs', default = None)
+    parser.add_argument('--catalog_path', type = str, help = 'SQLite catalog of the products found by earlier searches; only the periods not covered yet are searched on the Data Store', default = None)
+    parser.add_argument('--product_cache_max_gb', type = float, help = 'Size cap of the product cache in GB; least recently used products are evicted first', default = 20)
+    parser.add_argument('--download_retries', type = int, help = 'Download attempts per product before giving up on the timestep', default = 3)
+    parser.add_argument('--mode', type = str, choices = PIPELINE_MODES, default = 'sequential', help = 'sequential: download, process and write one timestep at a time. pipeline: overlap the download of the next timesteps with the processing of the current one')
+    parser.add_argument('--queue_size', type = int, help = 'Timesteps buffered between the pipeline stages (pipeline mode)', default = 2)
+    parser.add_argument('--process_workers', type = int, help = 'Threads decoding and resampling timesteps (pipeline mode)', default = 1)
+    parser.add_argument('--low_memory', action = 'store_true', help = 'Crop the scene to the selected area(s) before resampling and decode the products in small chunks to bound peak memory')
+    parser.add_argument('--memory_budget_mb', type = int, help = 'Approximate peak memory for decoding in low-memory mode, in MB', default = 2048)
+    parser.add_argument('--no_crop', action = 'store_true', help = 'Resample the full scene instead of cropping it to the selected area(s) first')
+    parser.add_argument('--workers', type = int, help = 'Worker processes decoding and resampling timesteps in parallel (one per core for backfills)', default = 1)
+    parser.add_argument('--partial_download', action = 'store_true', help = 'Download only the header, trailer and scan lines of the native file covering the selected area(s)')
+    parser.add_argument('--window_hours', type = float, help = 'Backfill mode: process the date range in windows of this many hours, checkpointing after each one so a restarted run resumes where it stopped', default = None)
+    parser.add_argument('--checkpoint_path', type = str, help = 'Backfill checkpoint file (default: backfill_<SAT>_<start>_<end>.json in output_path)', default = None)
+    parser.add_argument('--daemon', action = 'store_true', help = 'Keep running and process the new products every --poll_minutes (from --start_date, or --lookback_minutes ago, until --end_date or Ctrl+C)')
+    parser.add_argument('--poll_minutes', type = float, help = 'Minutes between two polls in daemon mode', default = CADENCE_MINUTES['MSG'])
+    parser.add_argument('--lookback_minutes', type = float, help = 'How far back the first poll of the daemon looks when --start_date is not given (default: two polls)', default = None)
+    parser.add_argument('--no_retry_failed', action = 'store_true', help = 'Do not re-run the backfill windows with failed timesteps when resuming')
+    parser.add_argument('--list_channels', action = 'store_true', help = 'List the available channels and composites with their resolution, then exit')
+    parser.add_argument('--list_regions', action = 'store_true', help = 'List the predefined regions with their extent, then exit')
+    parser.add_argument('--dry_run', action = 'store_true', help = 'Validate the arguments and print what the run would produce (dates, channels, regions, outputs) without credentials or downloads')
+    return parser
+
+def print_banner():
+    print(f'Started execution at: {datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")}')
+    print("===========================================")
+    print("================ EUMETSAT MSG ================")
+    print("===========================================")
+
+    print(BANNER)
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.list_channels:
+        print_channels(MSG_RESOLUTIONS)
+        return
+    if args.list_regions:
+        print_regions()
+        return
+
+    channel = args.channel if args.channel is not None else 'HRV'
+
+    try:
+        plan = plan_run('MSG', MSG_RESOLUTIONS, channel, args.country, args.lat_min, args.lat_max, args.lon_min, args.lon_max,
+                        start_date=args.start_date, end_date=args.end_date, output_path=args.output_path,
+                        output_format=args.output_format, save_as_npy=args.save_as_npy, window_hours=args.window_hours,
+                        daemon=args.daemon, poll_minutes=args.poll_minutes)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.dry_run:
+        print_plan(plan)
+        return
+
+    # ========== AUTHENTIFICATION ==========
+
+    if args.consumer_key is not None:
+        cons_key = args.consumer_key
     else:
-        return img
-    
-# ========== GET SOLAR ANGLE ==========
-
-def get_sun_elevation(dt_utc, lat=39.6, lon=2.9):
-    ts = load.timescale()
-    t = ts.utc(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute)
-    eph = load('de421.bsp')
-    sun = eph['sun']
-    earth = eph['earth']
-    location = earth + wgs84.latlon(latitude_degrees=lat, longitude_degrees=lon)
-    astrometric = location.at(t).observe(sun)
-    alt, az, _ = astrometric.apparent().altaz()
-    return alt.degrees
-
-# ========== AUTHENTIFICATION ==========
-
-if args.consumer_key is not None:
-    cons_key = args.consumer_key
-else:
-    raise Exception("Missing required argument: --consumer_key")
-
-if args.consumer_secret is not None:
-    cons_secret = args.consumer_secret
-else:
-    raise Exception("Missing required argument: --consumer_secret")
-
-credentials = (cons_key, cons_secret)
-token = AccessToken(credentials)
-datastore = DataStore(token)
-selected_collection = datastore.get_collection('EO:EUM:DAT:MSG:MSG15-RSS')
-
-# ========= AREA MAPS =========
-resolution_map = {
-    'HRV': 1000,
-    'IR_016': 3000,
-    'IR_039': 3000,
-    'IR_087': 3000,
-    'IR_097': 3000,
-    'IR_108': 3000,
-    'IR_120': 3000,
-    'IR_134': 3000,
-    'VIS006': 3000,
-    'VIS008': 3000,
-    'WV_062': 3000,
-    'WV_073': 3000
-}
-
-composite_map = {
-    '24h_microphysics': 3000,
-    'airmass': 3000,
-    'ash': 3000,
-    'cloud_phase_distinction': 3000,
-    'cloud_phase_distinction_raw': 3000,
-    'cloudtop': 3000,
-    'cloudtop_daytime': 3000,
-    'colorized_ir_clouds': 3000,
-    'convection': 3000,
-    'day_microphysics': 3000,
-    'day_microphysics_winter': 3000,
-    'day_severe_storms': 3000,
-    'day_severe_storms_tropical': 3000,
-    'dust': 3000,
-    'fog': 3000,
-    'green_snow': 3000,
-    'hrv_clouds': 1000,
-    'hrv_fog': 1000,
-    'hrv_severe_storms': 1000,
-    'hrv_severe_storms_masked': 1000,
-    'ir108_3d': 3000,
-    'ir_cloud_day': 3000,
-    'ir_overview': 3000,
-    'ir_sandwich': 3000,
-    'natural_color': 3000,
-    'natural_color_nocorr': 3000,
-    'natural_color_raw': 3000,
-    'natural_color_raw_with_night_ir': 3000,
-    'natural_color_with_night_ir': 3000,
-    'natural_color_with_night_ir_hires': 3000,
-    'natural_enh': 3000,
-    'natural_enh_with_night_ir': 3000,
-    'natural_enh_with_night_ir_hires': 3000,
-    'natural_with_night_fog': 3000,
-    'night_fog': 3000,
-    'night_ir_alpha': 3000,
-    'night_ir_with_background': 3000,
-    'night_ir_with_background_hires': 3000,
-    'night_microphysics': 3000,
-    'night_microphysics_tropical': 3000,
-    'overshooting_tops': 3000,
-    'overview': 3000,
-    'overview_raw': 3000,
-    'realistic_colors': 3000,
-    'rocket_plume_day': 3000,
-    'rocket_plume_night': 3000,
-    'snow': 3000,
-    'vis_sharpened_ir': 3000
-}
-
-resolution_map.update(composite_map)
-
-# === PREDEFINED AREAS ===
-
-def compute_pixel_dimensions(area_extent, meters_per_pixel=500):
-    lon_min, lat_min, lon_max, lat_max = area_extent
-
-    # Use Mercator projection for distance in meters
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-
-    x_min, y_min = transformer.transform(lon_min, lat_min)
-    x_max, y_max = transformer.transform(lon_max, lat_max)
-
-    width_m = abs(x_max - x_min)
-    height_m = abs(y_max - y_min)
+        parser.error("Missing required argument: --consumer_key")
 
-    width_px = int(width_m / meters_per_pixel)
-    height_px = int(height_m / meters_per_pixel)
-
-    return width_px, height_px
-
-def create_area(name, area_extent, channel):
-    xpix, ypix = compute_pixel_dimensions(area_extent, resolution_map[channel])
-    return create_area_def(
-        name,
-        {'proj': 'latlong', 'datum': 'WGS84'},
-        width=xpix,
-        height=ypix,
-        area_extent=area_extent
+    if args.consumer_secret is not None:
+        cons_secret = args.consumer_secret
+    else:
+        parser.error("Missing required argument: --consumer_secret")
+
+    print_banner()
+    from EumetSat_MSG_class import EumetSatMSG
+
+    processor = EumetSatMSG(
+        consumer_key=cons_key,
+        consumer_secret=cons_secret,
+        ephemeris_path=args.ephemeris_path,
+        resampler_cache_dir=args.resampler_cache_dir,
+        product_cache_dir=args.product_cache_dir,
+        product_cache_max_gb=args.product_cache_max_gb,
+        catalog_path=args.catalog_path
     )
 
-area_defs = {
-    'balearic_islands': create_area('balearic_islands', [1.0, 38.5, 4.5, 40.27], channel),
-    'iberia': create_area('iberia', [-10.0, 35.0, 4.5, 44.5], channel),
-    'france': create_area('france', [-5.5, 41.0, 9.5, 51.5], channel),
-    'uk_ireland': create_area('uk_ireland', [-11.0, 49.5, 3.5, 60.0], channel),
-    'germany_benelux': create_area('germany_benelux', [2.5, 47.0, 14.5, 55.0], channel),
-    'scandinavia': create_area('scandinavia', [5.0, 55.0, 25.0, 71.5], channel),
-    'italy': create_area('italy', [6.0, 36.0, 19.0, 47.0], channel),
-    'greece':create_area('greece', [19.0, 34.5, 29.5, 42.5], channel),
-    'balkans':create_area('balkans', [13.0, 36.0, 30.0, 47.5], channel)
-}
-
-countries_dict = {'iberia':area_defs['iberia'],
-                  'balearic_islands':area_defs['balearic_islands'],
-                  'france':area_defs['france'],
-                  'uk_ireland':area_defs['uk_ireland'],
-                  'germany_benelux':area_defs['germany_benelux'],
-                  'scandinavia':area_defs['scandinavia'],
-                  'italy':area_defs['italy'],
-                  'greece':area_defs['greece'],
-                  'balkans':area_defs['balkans']}
-
-
-use_custom_roi = all([
-    args.lat_min is not None,
-    args.lat_max is not None,
-    args.lon_min is not None,
-    args.lon_max is not None
-])
+    # ========== DOWNLOAD AND PROCESS PRODUCTS ==========
 
-if use_custom_roi:
-    manual_extent = [args.lon_min, args.lat_min, args.lon_max, args.lat_max]
-    area_def_custom = create_area('custom_area', manual_extent, channel)
-
-    roi_polygon = Polygon([
-        (args.lon_min, args.lat_min),
-        (args.lon_min, args.lat_max),
-        (args.lon_max, args.lat_max),
-        (args.lon_max, args.lat_min)
-    ])
-
-    area_def = area_def_custom
-else:
-    if args.country not in countries_dict:
-        raise ValueError(f"Invalid country: {args.country}. Choose from: {list(countries_dict.keys())}")
-
-    area_def = countries_dict[args.country]
-
-# ========== GENERATE AREA ==========
-def create_area(name, area_extent, channel):
-    xpix, ypix = compute_pixel_dimensions(area_extent, resolution_map[channel])
-    return create_area_def(
-        name,
-        {'proj': 'latlong', 'datum': 'WGS84'},
-        width=xpix,
-        height=ypix,
-        area_extent=area_extent
+    if args.daemon:
+        download = functools.partial(processor.daemon, poll_minutes=args.poll_minutes, lookback_minutes=args.lookback_minutes)
+    elif args.window_hours is not None:
+        download = functools.partial(processor.backfill, window_hours=args.window_hours, checkpoint_path=args.checkpoint_path, retry_failed=not args.no_retry_failed)
+    else:
+        download = processor.get_image
+
+    download(
+        start_date=args.start_date,
+        end_date=args.end_date,
+        output_path=args.output_path,
+        skip_night_angle=args.skip_night_angle,
+        country=args.country,
+        channel=channel,
+        lat_min=args.lat_min,
+        lat_max=args.lat_max,
+        lon_min=args.lon_min,
+        lon_max=args.lon_max,
+        save_as_npy=args.save_as_npy,
+        enhance_img=args.enhance_img,
+        sun_sampling=args.sun_sampling,
+        mask_night_pixels=args.mask_night_pixels,
+        download_retries=args.download_retries,
+        mode=args.mode,
+        queue_size=args.queue_size,
+        process_workers=args.process_workers,
+        workers=args.workers,
+        partial_download=args.partial_download,
+        low_memory=args.low_memory,
+        memory_budget_mb=args.memory_budget_mb,
+        crop=not args.no_crop,
+        output_format=args.output_format,
+        stretch=args.stretch,
+        stretch_decay=args.stretch_decay
     )
 
-# ========== DDOWNLOAD PRODUCTS ==========
-products = selected_collection.search(dtstart=dtstart, dtend=dtend)
-print(f"Found {len(products)} matching timestep(s).")
-existing_stems = {os.path.splitext(f)[0].lower() for f in os.listdir(output_path)}
-
-# If no start datetime is provided, retrieve the most recent product available
-for i, product in enumerate(products):
-    if last_product and i > 0:
-        continue
-    for entry in product.entries:
-        try:
-            local_filename = os.path.basename(entry)
-            if not local_filename.endswith('.nat'):
-                continue
-            try:
-                ts_str = local_filename.split('-')[5]  
-                ts_str = ts_str.split('.')[0]          
-                ts_dt = datetime.datetime.strptime(ts_str, "%Y%m%d%H%M%S")
-            except Exception as e:
-                print(f"Failed to parse timestamp from filename: {local_filename} ({e})")
-                continue
-
-            effective_channel = (args.channel or 'HRV')          # always a string
-            channel_norm = effective_channel.lower()   
-
-            base_name = f"{channel_norm}_{ts_dt.strftime('%Y%m%dT%H%M%S')}" 
-
-            # Skip if we've already produced this timestamp (either .jpg or .npy), any case
-            if base_name.lower() in existing_stems:
-                print(f"{base_name} already exists. Skipping download.")
-                continue
-
-            # === SKIP IF THE SUN ANGLE IS BELOW A CERTAIN THRESHOLD ===
-            if skip_night_angle:
-                sun_elev = get_sun_elevation(ts_dt)
-                print(f"Sun elevation at {ts_dt} UTC: {sun_elev:.2f}°")
-                if sun_elev < skip_night_angle: # 25º as threshold
-                    print("Skipping due to low sun angle.")
-                    continue
-
-            with product.open(entry=entry) as fsrc:
-
-                print(f"Downloading: {local_filename} | UTC Time: {ts_dt.strftime('%Y-%m-%d %H:%M')}")
-                local_filepath = os.path.join(output_path, local_filename)
-                with open(local_filepath, 'wb') as fdst:
-                    shutil.copyfileobj(fsrc, fdst)
-                print(f"Saved: {local_filename}")
-                try:
-                    scn = Scene(filenames=[local_filepath], reader='seviri_l1b_native')
-                    # print(scn.available_composite_ids())
-                    scn.load([effective_channel])
-                    scn_resampled = scn.resample(area_def)
-                    img = scn_resampled[effective_channel].values
-                    if img.ndim == 3 and img.shape[0] == 3:
-                        img = np.moveaxis(img, 0, -1)
-    
-                    if args.save_as_npy:
-                        ts_str = ts_dt.strftime('%Y%m%dT%H%M%S')
-                        base_name = f"{channel_norm.lower()}_{ts_str}"
-                        npy_path = os.path.join(output_path, f"{base_name}.npy")
-                        np.save(npy_path, img)
-                        print(f'Saved at {output_path}')
-                        print(f"Saved array: {os.path.basename(npy_path)}  shape={img.shape} dtype={img.dtype}")
-                        # print(f'Just to see the saved file: {img} ')
-
-                    else:
-                        img = handle_color(img, enhance = args.enhance_img)
-                        if any(v is None for v in [args.lon_min, args.lon_max, args.lat_min, args.lat_max]) and args.country is not None:
-                            img_name = f"MSG_{channel}_{args.country}_{ts_dt.strftime('%Y%m%dT%H%M%S')}.jpg"
-                        elif any(v is not None for v in [args.lon_min, args.lon_max, args.lat_min, args.lat_max]) and args.country is None:
-                            img_name = f"MSG_{channel}_LON{args.lon_min}S{args.lon_max}_LAT{args.lat_min}S{args.lat_max}_{ts_dt.strftime('%Y%m%dT%H%M%S')}.jpg"
-                        else:
-                            raise Exception('Mixture of predefined country and customs areas found. Pick one please.')
-                        cv2.imwrite(os.path.join(output_path, img_name), img)
-                        print(f'Saved at {output_path}')
-                        print(f"Saved image: {img_name}")
-                    existing_stems.add(base_name)
-                    os.remove(local_filepath)
-
-                except Exception as e:
-                    print(f"Error processing scene: {e}")
-
-                print('====================================================')
-
-        except Exception as e:
-            print(f"Download failed for {entry}: {e}")
+# ========== MAIN ==========
+# Guarded so the --workers processes can import this module on spawn-based platforms
 
-        finally:
-            elapsed = time.time() - start
-end = time.time()
-elapsed = end - start
-print(f'Ended execution at: {datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")}. It took {elapsed:.2f} seconds.')
\ No newline at end of file
+if __name__ == "__main__":
+    main()
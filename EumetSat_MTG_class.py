@@ -1,31 +1,60 @@
 import os
-import shutil
 import datetime
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from eumdac import DataStore, AccessToken
-from pyresample import create_area_def
+import dask
 from satpy import Scene
 from dateutil.relativedelta import relativedelta
 import cv2
-from pyproj import Transformer
 import gc
-from skyfield.api import load, wgs84
+import threading
+from EumetSat_utils import product_sensing_time, mask_night, get_region_area, REGION_EXTENTS, fetch_entry, run_pipeline, PIPELINE_MODES, group_targets_by_area, low_memory_dask_config, crop_to_areas, record_failure, report_failures
+from EumetSat_storage import get_output_store
+from EumetSat_options import MTG_RESOLUTIONS
+from EumetSat_base import EumetSatBase
 from shapely.wkt import loads
-from shapely.geometry import Polygon
+from shapely.geometry import box
+from shapely.strtree import STRtree
 import warnings
 warnings.filterwarnings('ignore')
 
-class EumetSatMTG:
-    def __init__(self, consumer_key=None, consumer_secret=None):
-        if not consumer_key or not consumer_secret:
-            raise Exception("Consumer key and secret are required.")
-        self.last_picture = False
-        self.credentials = (consumer_key, consumer_secret)
-        self.token = AccessToken(self.credentials)
-        self.datastore = DataStore(self.token)
-        self.selected_collection = self.datastore.get_collection('EO:EUM:DAT:0665')
+# ========== FCI CHUNK INDEX ==========
+# The chunk footprints are held in an STRtree built once per instance; queries
+# return the IDs of the chunks intersecting any (multi)polygon and bounding box
+# results are cached. Predefined countries are resolved the same way from their
+# extent, so only the chunks actually covering the area are downloaded.
+
+class ChunkIndex:
+    def __init__(self, chunk_polygons):
+        self.chunk_ids = list(chunk_polygons.keys())
+        self.polygons = list(chunk_polygons.values())
+        self.tree = STRtree(self.polygons)
+        self._bbox_cache = {}
+        self._lock = threading.Lock()
+
+    def query(self, geometry):
+        hits = self.tree.query(geometry, predicate='intersects')
+        return sorted(self.chunk_ids[i] for i in hits)
+
+    def query_bbox(self, lon_min, lat_min, lon_max, lat_max):
+        key = (float(lon_min), float(lat_min), float(lon_max), float(lat_max))
+        with self._lock:
+            if key not in self._bbox_cache:
+                self._bbox_cache[key] = self.query(box(*key))
+            return self._bbox_cache[key]
+
+class EumetSatMTG(EumetSatBase):
+    satellite = 'MTG'
+    collection_id = 'EO:EUM:DAT:0665'
+    resolutions = MTG_RESOLUTIONS
+    default_channel = 'vis_06'
+    default_poll_minutes = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.chunk_polygons = self._load_chunks("FCI_chunks.wkt")
-        self.resolution = {'vis_06':500, 'nir_22':500, 'ir_38':1000, 'ir_105':1000}
+        self.chunk_index = ChunkIndex(self.chunk_polygons)
 
     def _load_chunks(self, wkt_file_path):
         if not os.path.exists(wkt_file_path):
@@ -39,95 +68,126 @@ class EumetSatMTG:
             chunk_polygons[chunk_id] = loads(wkt_poly)
         return chunk_polygons
 
-    def _get_sun_elevation(self, dt_utc, lat=39.6, lon=2.9):
-        ts = load.timescale()
-        t = ts.utc(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute)
-        eph = load('de421.bsp')
-        sun = eph['sun']
-        earth = eph['earth']
-        location = earth + wgs84.latlon(latitude_degrees=lat, longitude_degrees=lon)
-        astrometric = location.at(t).observe(sun)
-        alt, _, _ = astrometric.apparent().altaz()
-        return alt.degrees
-
-    def handle_color(self, img, qmin=1, qmax=99, enhance = True):
-        if img.ndim == 3 and img.shape[-1] == 3:
-            if np.allclose(img[...,0], img[...,1]) and np.allclose(img[...,1], img[...,2]):
-                img = img[...,0] 
-        if enhance:
-            data = np.nan_to_num(img, nan=0.0)
-            if data.ndim == 2:  # grayscale
-                vmin, vmax = np.percentile(data, (qmin, qmax))
-                scaled = np.clip((data - vmin) / (vmax - vmin), 0, 1)
-                return (255 * scaled).astype(np.uint8)
-
-            elif data.ndim == 3 and data.shape[-1] == 3:  # RGB
-                out = np.zeros_like(data, dtype=np.uint8)
-                for i in range(3):
-                    vmin, vmax = np.percentile(data[..., i], (qmin, qmax))
-                    scaled = np.clip((data[..., i] - vmin) / (vmax - vmin), 0, 1)
-                    out[..., i] = (255 * scaled).astype(np.uint8)
-                return out
-        else:
-            return img
-
-    def _compute_pixel_dimensions(self, area_extent, meters_per_pixel=500):
-        lon_min, lat_min, lon_max, lat_max = area_extent
-        transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-        x_min, y_min = transformer.transform(lon_min, lat_min)
-        x_max, y_max = transformer.transform(lon_max, lat_max)
-        width_px = int(abs(x_max - x_min) / meters_per_pixel)
-        height_px = int(abs(y_max - y_min) / meters_per_pixel)
-        return width_px, height_px
-
-    def _create_area(self, name, area_extent, channel):
-        xpix, ypix = self._compute_pixel_dimensions(area_extent, meters_per_pixel = self.resolution[channel])
-        return create_area_def(name, {'proj': 'latlong', 'datum': 'WGS84'}, width=xpix, height=ypix, area_extent=area_extent)
-
     def _define_area(self, country, lat_min, lat_max, lon_min, lon_max, channel):
-        area_defs = {
-            'balearic_islands': self._create_area('balearic_islands', [1.0, 38.5, 4.5, 40.27], channel),
-            'iberia': self._create_area('iberia', [-10.0, 35.0, 4.5, 44.5], channel),
-            'france': self._create_area('france', [-5.5, 41.0, 9.5, 51.5], channel),
-            'uk_ireland': self._create_area('uk_ireland', [-11.0, 49.5, 3.5, 60.0], channel),
-            'germany_benelux': self._create_area('germany_benelux', [2.5, 47.0, 14.5, 55.0], channel),
-            'scandinavia': self._create_area('scandinavia', [5.0, 55.0, 25.0, 71.5], channel),
-            'italy': self._create_area('italy', [6.0, 36.0, 19.0, 47.0], channel),
-            'greece': self._create_area('greece', [19.0, 34.5, 29.5, 42.5], channel),
-            'balkans': self._create_area('balkans', [13.0, 36.0, 30.0, 47.5], channel)
-        }
-
-        countries_dict = {
-            'iberia': [area_defs['iberia'], ['0033', '0034', '0035', '0036']],
-            'balearic_islands': [area_defs['balearic_islands'], ['0034', '0035']],
-            'france': [area_defs['france'], ['0035', '0036', '0037']],
-            'uk_ireland': [area_defs['uk_ireland'], ['0037', '0038', '0039']],
-            'germany_benelux': [area_defs['germany_benelux'], ['0036', '0037', '0038']],
-            'scandinavia': [area_defs['scandinavia'], ['0038', '0039', '0040']],
-            'italy': [area_defs['italy'], ['0033', '0034', '0035', '0036']],
-            'greece': [area_defs['greece'], ['0033', '0034', '0035']],
-            'balkans': [area_defs['balkans'], ['0033', '0034', '0035', '0036']]
-        }
-
         if all(v is not None for v in [lat_min, lat_max, lon_min, lon_max]) and country is None:
             manual_extent = [lon_min, lat_min, lon_max, lat_max]
             area_def_custom = self._create_area('custom_area', manual_extent, channel)
-            roi_polygon = Polygon([
-                (lon_min, lat_min),
-                (lon_min, lat_max),
-                (lon_max, lat_max),
-                (lon_max, lat_min)
-            ])
-
-            relevant_chunks = [cid for cid, poly in self.chunk_polygons.items() if roi_polygon.intersects(poly)]
+            relevant_chunks = self.chunk_index.query_bbox(*manual_extent)
             if not relevant_chunks:
                 raise ValueError("No chunks intersect with the custom bounding box.")
             return area_def_custom, relevant_chunks
 
-        if country not in countries_dict:
-            raise ValueError(f"Invalid country: {country}. Choose from: {list(countries_dict.keys())}")
+        if country not in REGION_EXTENTS:
+            raise ValueError(f"Invalid country: {country}. Choose from: {list(REGION_EXTENTS.keys())}")
+
+        relevant_chunks = self.chunk_index.query_bbox(*REGION_EXTENTS[country])
+        if not relevant_chunks:
+            raise ValueError(f"No chunks intersect with {country}.")
+        return [get_region_area(country, self.resolution[channel]), relevant_chunks]
+
+    def _select_chunk_entries(self, product, chunk_patterns, output_path):
+        selected = []
+        for entry in product.entries:
+            if any(pattern in entry for pattern in chunk_patterns):
+                local_filename = os.path.basename(entry)
+                selected.append((entry, os.path.join(output_path, local_filename)))
+        return selected
+
+    def _timestep_time(self, product):
+        # Sensing start of the repeat cycle, the same whichever chunks are selected (the
+        # chunk names carry their own creation and sensing times); from the product
+        # identifier (..._C_EUMT_<created>_<facility>_<env>_<sensing start>_...) if needed
+        ts_dt = product_sensing_time(product)
+        if ts_dt is not None:
+            return ts_dt.replace(microsecond=0)
+        try:
+            ts_str = str(product).split('_C_EUMT_')[1].split('_')[3][:14]
+            return datetime.datetime.strptime(ts_str, "%Y%m%d%H%M%S")
+        except Exception:
+            print(f"Failed to parse the sensing time of {product}")
+            return None
+
+    def _submit_chunk_downloads(self, pool, product, chunk_patterns, run):
+        selected = self._select_chunk_entries(product, chunk_patterns, run['output_path'])
+        if not selected:
+            return None
+        # Skip if every output of this timestep is already in the manifest
+        ts_dt = self._timestep_time(product)
+        if ts_dt is None:
+            return None
+        targets = [target for target in run['targets'] if not self._target_done(target, ts_dt, run)]
+        if not targets:
+            print(f"Outputs for {ts_dt.strftime('%Y%m%dT%H%M%S')} already exist. Skipping download.")
+            return None
+        downloads = []
+        for entry, local_filepath in selected:
+            print(f"Downloading: {os.path.basename(local_filepath)}")
+            future = pool.submit(fetch_entry, product, entry, local_filepath, run['download_retries'], self.product_cache)
+            downloads.append((entry, local_filepath, future))
+        return {'ts_dt': ts_dt, 'targets': targets, 'downloads': downloads}
+
+    def _collect_chunk_downloads(self, pending, run):
+        if pending is None:
+            return None
+        downloaded_files = []
+        failed = 0
+        for entry, local_filepath, future in pending['downloads']:
+            try:
+                downloaded_files.append(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"Download failed for {entry}: {e}")
+        if failed:
+            print(f"Skipping timestep: {failed} chunk(s) could not be downloaded.")
+            record_failure(run, pending['ts_dt'], 'download', f"{failed} chunk(s) could not be downloaded")
+            self._remove_files(downloaded_files)
+            return None
+        if not downloaded_files:
+            return None
+        print(f"Saved: {[os.path.basename(f) for f in downloaded_files]}")
+        return {'ts_dt': pending['ts_dt'], 'targets': pending['targets'], 'files': downloaded_files}
+
+    def _process_timestep(self, job, run):
+        width = run['width']
+        try:
+            # All the channels are loaded from one Scene, which is then cropped to the footprint
+            # of each target area and resampled once per area
+            scn = Scene(filenames=job['files'], reader="fci_l1c_nc")
+            scn.load(list(dict.fromkeys(target['channel'] for target in job['targets'])))
+            images = []
+            for area_def, area_targets in group_targets_by_area(job['targets']):
+                area_scn = crop_to_areas(scn, [area_def]) if run['crop'] else scn
+                scn_resampled = self.resampler_cache.resample(area_scn, area_def, datasets=[target['channel'] for target in area_targets])
+                for target in area_targets:
+                    img = scn_resampled[target['channel']].values
+                    img =(img).astype(np.float32)
+                    if run['mask_night_pixels'] and run['skip_night_angle'] is not None:
+                        img = mask_night(img, area_def, job['ts_dt'], run['skip_night_angle'])
+                    img_height, img_width = img.shape
+                    if width is not None:
+                        new_width = width
+                        aspect_ratio = img_height / img_width
+                        new_height = int(new_width * aspect_ratio)
+                        img_resized = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                    else:
+                        img_resized = img  # No resizing
+                    # The running stretch is applied in order when the timesteps are written
+                    if not run['save_as_npy'] and run['stretch'] is None:
+                        img_resized = self.handle_color(img_resized, enhance = run['enhance_img'])
+                    images.append((target, img_resized))
+                del area_scn
+                del scn_resampled
+            job['images'] = images
 
-        return countries_dict[country]
+            del scn
+            del img
+            gc.collect() 
+            return job
+        except Exception as e:
+            print(f"Error processing scene: {e}")
+            record_failure(run, job['ts_dt'], 'process', e)
+            self._remove_files(job['files'])
+            return None
 
     def get_available_ids(self):
         print(
@@ -141,12 +201,38 @@ class EumetSatMTG:
         " DataID(name='vis_06', wavelength=WavelengthRange(min=0.59, central=0.64, max=0.69, unit='µm'), resolution=500, calibration=<1>, modifiers=())\n" \
         " ===========================================================" )
 
+    def _prepare_run(self, width=None, download_workers=4, **kwargs):
+        run = super()._prepare_run(**kwargs)
+        run['width'] = width
+        run['download_workers'] = download_workers
+        return run
+
+    def _run_targets(self, run, channels):
+        targets = []
+        chunk_ids = set()
+        for region in run['regions']:
+            for ch in channels:
+                area_def, region_chunk_ids = self._define_area(region, run['lat_min'], run['lat_max'], run['lon_min'], run['lon_max'], ch)
+                targets.append({'channel': ch, 'region': region, 'area_def': area_def})
+                chunk_ids.update(region_chunk_ids)
+        run['chunk_patterns'] = [f"_{cid}.nc" for cid in sorted(chunk_ids)]
+        return targets
+
+    def _target_area(self, target):
+        return target['area_def']
+
+    @contextlib.contextmanager
+    def _downloader(self, run):
+        # The chunks of each timestep are fetched in parallel through one shared pool
+        with ThreadPoolExecutor(max_workers=run['download_workers']) as pool:
+            yield lambda product: self._collect_chunk_downloads(self._submit_chunk_downloads(pool, product, run['chunk_patterns'], run), run)
+
     def get_image(self,
                   start_date,
                   end_date,
                   output_path=None,
                   skip_night_angle=25,
-                  country='iberia',
+                  country=None,
                   channel='vis_06',
                   lat_min=None,
                   lat_max=None,
@@ -154,11 +240,32 @@ class EumetSatMTG:
                   lon_max=None,
                   width = None,
                   save_as_npy = False,
-                  enhance_img = False
+                  enhance_img = False,
+                  sun_sampling = 'center',
+                  mask_night_pixels = False,
+                  download_workers = 4,
+                  download_retries = 3,
+                  prefetch_next = False,
+                  mode = 'sequential',
+                  queue_size = 2,
+                  process_workers = 1,
+                  low_memory = False,
+                  memory_budget_mb = 2048,
+                  crop = True,
+                  output_format = None,
+                  stretch = 'frame',
+                  stretch_decay = 0.9
                   ):
-        if country is not None:
-            country = country.lower()
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Choose from: {list(PIPELINE_MODES)}")
+        run = self._prepare_run(output_path=output_path, skip_night_angle=skip_night_angle, country=country, channel=channel,
+                                lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max, width=width,
+                                save_as_npy=save_as_npy, enhance_img=enhance_img, sun_sampling=sun_sampling,
+                                mask_night_pixels=mask_night_pixels, download_workers=download_workers,
+                                download_retries=download_retries, low_memory=low_memory, crop=crop,
+                                output_format=output_format, stretch=stretch, stretch_decay=stretch_decay)
         try:
+            self.last_picture = False
             dtstart = datetime.datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%S")
             dtend = datetime.datetime.strptime(end_date, "%Y-%m-%dT%H:%M:%S")
         except Exception as e:
@@ -168,91 +275,45 @@ class EumetSatMTG:
             dtend = now
             dtstart = now - relativedelta(minutes=20)
             print(f"[INFO] Using fallback times: start={dtstart}, end={dtend}")
-        output_path = output_path or os.path.join(os.getcwd(), 'imgs')
-        os.makedirs(output_path, exist_ok=True)
 
-        area_def, chunk_ids = self._define_area(country, lat_min, lat_max, lon_min, lon_max, channel)
-        products = self.selected_collection.search(dtstart=dtstart, dtend=dtend)
-        print(f"Found {len(products)} matching timestep(s).")
+        products = self._search_products(dtstart, dtend, run)
+        run['store'] = get_output_store(run['output_format'], run['output_path'], 'MTG', capacity=len(products))
+        chunk_patterns = run['chunk_patterns']
 
-        chunk_patterns = [f"_{cid}.nc" for cid in chunk_ids]
+        # The memory budget is shared by the timesteps processed concurrently
+        dask_config = {}
+        if low_memory:
+            dask_config = low_memory_dask_config(memory_budget_mb / (process_workers if mode == 'pipeline' else 1))
 
-        for i, product in enumerate(products):
-            if self.last_picture and i > 0:
-                continue
-            downloaded_files = []
-            for entry in product.entries:
-                if any(pattern in entry for pattern in chunk_patterns):
-                    local_filename = os.path.basename(entry)
-                    try:
-                        ts_str = local_filename.split('_C_EUMT_')[1][:14]
-                        ts_dt = datetime.datetime.strptime(ts_str, "%Y%m%d%H%M%S")
-                    except:
-                        print(f"Failed to parse timestamp from filename: {local_filename}")
-                        continue
-
-                    if skip_night_angle is not None:
-                        sun_elev = self._get_sun_elevation(ts_dt)
-                        print(f"Sun elevation at {ts_dt} UTC: {sun_elev:.2f}°")
-                        if sun_elev < skip_night_angle:
-                            print("Skipping due to low sun angle.")
-                            continue
-
-                    print(f"Downloading: {local_filename}")
-                    local_filepath = os.path.join(output_path, local_filename)
-                    with product.open(entry=entry) as fsrc, open(local_filepath, 'wb') as fdst:
-                        shutil.copyfileobj(fsrc, fdst)
-                    downloaded_files.append(local_filepath)
-
-            print(f"Saved: {[os.path.basename(f) for f in downloaded_files]}")
-            try:
-                scn.load([channel])  
-                scn_resampled = scn.resample(area_def)
-                img = scn_resampled[channel].values
-                img =(img).astype(np.float32)
-                if any(v is None for v in [lon_min, lon_max, lat_min, lat_max]) and country is not None:
-                    img_name = f"MTG_{channel}_{country}_{ts_dt.strftime('%Y%m%dT%H%M%S')}.jpg"
-                elif any(v is not None for v in [lon_min, lon_max, lat_min, lat_max]) and country is None:
-                    img_name = f"MTG_{channel}_LON{lon_min}S{lon_max}_LAT{lat_min}S{lat_max}_{ts_dt.strftime('%Y%m%dT%H%M%S')}.jpg"
-                else:
-                    raise Exception('Mixture of predefined country and customs areas found. Pick one please.')
-                img_height, img_width = img.shape
-                if width is not None:
-                    new_width = width
-                    aspect_ratio = img_height / img_width
-                    new_height = int(new_width * aspect_ratio)
-                    img_resized = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
-                else:
-                    img_resized = img  # No resizing
-                
-                if save_as_npy:
-                    ts_str = ts_dt.strftime('%Y%m%dT%H%M%S')
-                    base_name = f"{channel.lower()}_{ts_str}"
-                    npy_path = os.path.join(output_path, f"{base_name}.npy")
-                    np.save(npy_path, img_resized)
-                    print(f'Saved at {output_path}')
-                    print(f"Saved array: {os.path.basename(npy_path)}  shape={img_resized.shape} dtype={img_resized.dtype}")
-                else:
-                    img_scaled = self.handle_color(img_resized, enhance = enhance_img)
-                    cv2.imwrite(os.path.join(output_path, img_name), img_scaled)
-                    print(f"Saved image: {img_name}")
+        # Chunks of a timestep are fetched in parallel. In pipeline mode the next timesteps
+        # download while earlier ones are resampled; in sequential mode prefetch_next
+        # downloads the chunks of the following timestep while the current one is processed
+        with ThreadPoolExecutor(max_workers=download_workers) as pool, dask.config.set(dask_config):
+            if mode == 'pipeline':
+                run_pipeline(products,
+                             lambda product: self._collect_chunk_downloads(self._submit_chunk_downloads(pool, product, chunk_patterns, run), run),
+                             lambda job: self._process_timestep(job, run),
+                             lambda job: self._write_timestep(job, run),
+                             queue_size=queue_size,
+                             process_workers=process_workers)
+            else:
+                next_downloads = None
+                for i, product in enumerate(products):
+                    # With prefetch_next the current timestep was submitted on the previous iteration
+                    downloads = next_downloads if prefetch_next and i > 0 else self._submit_chunk_downloads(pool, product, chunk_patterns, run)
+                    if prefetch_next and i + 1 < len(products):
+                        next_downloads = self._submit_chunk_downloads(pool, products[i + 1], chunk_patterns, run)
 
-                del scn
-                del scn_resampled
-                del img
-                del img_resized
-                gc.collect() 
-            except Exception as e:
-                print(f"Error processing scene: {e}")
-            finally:
-                for file in downloaded_files:
-                    if os.path.exists(file):
-                        try:
-                            os.remove(file)
-                        except Exception as e:
-                            print(f"Error deleting file {file}: {e}")
+                    job = self._collect_chunk_downloads(downloads, run)
+                    if job is None:
+                        continue
+                    job = self._process_timestep(job, run)
+                    if job is None:
+                        continue
+                    self._write_timestep(job, run)
 
-            print("===========================================")
+        report_failures(run['failures'])
+        return run['failures']
 
 # ========== MAIN ==========
 
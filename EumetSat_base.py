@@ -0,0 +1,245 @@
+import os
+import datetime
+import functools
+import threading
+import time
+import numpy as np
+import dask
+import cv2
+from EumetSat_utils import get_sun_ephemeris, product_sensing_time, compute_pixel_dimensions, get_area, get_resampler_cache, get_product_cache, handle_color, as_list, output_filename, areas_sample_points, low_memory_dask_config, RunningStretch, STRETCH_MODES, record_failure, report_failures, run_backfill, backfill_windows, run_async_pipeline, run_daemon
+from EumetSat_storage import OUTPUT_FORMATS, get_output_store, OutputManifest
+from EumetSat_session import get_datastore
+from EumetSat_catalog import get_catalog
+from EumetSat_options import select_countries
+
+# ========== SHARED DRIVER ==========
+# Run preparation, product search, output writing and the backfill, daemon and asyncio
+# front-ends of EumetSatMSG and EumetSatMTG. Each satellite class sets the class
+# attributes below and provides its targets (_run_targets, _target_area), its
+# download step (_downloader) and its _process_timestep.
+
+class EumetSatBase:
+    satellite = None
+    collection_id = None
+    resolutions = {}
+    default_channel = None
+    default_poll_minutes = 5
+
+    def __init__(self, consumer_key=None, consumer_secret=None, ephemeris_path=None, resampler_cache_dir=None, product_cache_dir=None, product_cache_max_gb=20, datastore=None, catalog_path=None):
+        # datastore: any object with the eumdac DataStore get_collection API (e.g. a local
+        # stub serving files from disk); credentials are then not needed
+        if datastore is None and (not consumer_key or not consumer_secret):
+            raise Exception("Consumer key and secret are required.")
+        self.last_picture = False
+        self.credentials = (consumer_key, consumer_secret)
+        # The token, DataStore and HTTP connections are shared by the instances using the
+        # same credentials, and the token is renewed before it expires
+        self.datastore = datastore if datastore is not None else get_datastore(consumer_key, consumer_secret)
+        self.token = getattr(self.datastore, 'token', None)
+        self.sun = get_sun_ephemeris(ephemeris_path)
+        self.resampler_cache = get_resampler_cache(resampler_cache_dir)
+        self.product_cache = get_product_cache(product_cache_dir, product_cache_max_gb)
+        self.catalog = get_catalog(catalog_path)
+        self.running_stretch = None
+        self.latest_sensing_time = None
+        # get_images runs several window searches at a time
+        self._search_lock = threading.Lock()
+        self.selected_collection = self.datastore.get_collection(self.collection_id)
+        self.resolution = dict(self.resolutions)
+
+    def _get_sun_elevation(self, dt_utc, lat=39.6, lon=2.9):
+        return self.sun.sun_elevation(dt_utc, lat=lat, lon=lon)
+
+    def _filter_daylight(self, products, skip_night_angle, area_defs, sun_sampling='center'):
+        lats, lons = areas_sample_points(area_defs, sun_sampling)
+        mask = self.sun.daylight_mask([product_sensing_time(p) for p in products], skip_night_angle, lat=lats, lon=lons)
+        kept = [product for product, lit in zip(products, mask) if lit]
+        if len(kept) < len(products):
+            print(f"Skipping {len(products) - len(kept)} timestep(s) due to low sun angle.")
+        return kept
+
+    def handle_color(self, img, qmin=1, qmax=99, enhance = True):
+        return handle_color(img, qmin=qmin, qmax=qmax, enhance=enhance)
+
+    def _running_stretch(self, decay):
+        # Kept on the instance so that successive get_image calls continue the same sequence
+        if self.running_stretch is None or self.running_stretch.decay != decay:
+            self.running_stretch = RunningStretch(decay=decay)
+        return self.running_stretch
+
+    def _compute_pixel_dimensions(self, area_extent, meters_per_pixel=500):
+        return compute_pixel_dimensions(area_extent, meters_per_pixel=meters_per_pixel)
+
+    def _create_area(self, name, area_extent, channel):
+        return get_area(name, area_extent, self.resolution[channel])
+
+    def _remove_files(self, files):
+        # Files from the product cache are only released; they stay cached for later runs
+        if self.product_cache is not None:
+            files = self.product_cache.release(files)
+        for file in files:
+            if os.path.exists(file):
+                try:
+                    os.remove(file)
+                except Exception as e:
+                    print(f"Error deleting file {file}: {e}")
+
+    def _target_done(self, target, ts_dt, run):
+        if run['store'] is not None:
+            return run['manifest'].contains(self.satellite, target, ts_dt, run) or run['store'].contains(target, ts_dt, run)
+        return run['manifest'].contains(self.satellite, target, ts_dt, run, output_filename(self.satellite, target, ts_dt, run))
+
+    def _prepare_run(self,
+                     output_path=None,
+                     skip_night_angle=25,
+                     country=None,
+                     channel=None,
+                     lat_min=None,
+                     lat_max=None,
+                     lon_min=None,
+                     lon_max=None,
+                     save_as_npy = False,
+                     enhance_img = False,
+                     sun_sampling = 'center',
+                     mask_night_pixels = False,
+                     download_retries = 3,
+                     low_memory = False,
+                     crop = True,
+                     output_format = None,
+                     stretch = 'frame',
+                     stretch_decay = 0.9):
+        # channel and country accept a single name or a list: every channel is produced
+        # for every region from one download and one Scene per timestep
+        channels = as_list(channel) or [self.default_channel]
+        countries = select_countries(country, lat_min, lat_max, lon_min, lon_max)
+        regions = countries or [None]
+
+        output_path = output_path or os.path.join(os.getcwd(), 'imgs')
+        os.makedirs(output_path, exist_ok=True)
+        # npy, zarr and memmap store the raw (unenhanced) arrays
+        output_format = output_format or ('npy' if save_as_npy else 'jpg')
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Invalid output_format: {output_format}. Choose from: {list(OUTPUT_FORMATS)}")
+        save_as_npy = output_format != 'jpg'
+        if stretch not in STRETCH_MODES:
+            raise ValueError(f"Invalid stretch: {stretch}. Choose from: {list(STRETCH_MODES)}")
+        running_stretch = None
+        if stretch == 'running':
+            if enhance_img and not save_as_npy:
+                running_stretch = self._running_stretch(stretch_decay)
+            else:
+                print("[WARN] stretch='running' only applies to enhanced images (enhance_img with jpg output). Ignoring it.")
+
+        # 'store' is set once the number of timesteps is known
+        run = {
+            'output_path': output_path,
+            'regions': regions,
+            'lat_min': lat_min,
+            'lat_max': lat_max,
+            'lon_min': lon_min,
+            'lon_max': lon_max,
+            'skip_night_angle': skip_night_angle,
+            'sun_sampling': sun_sampling,
+            'mask_night_pixels': mask_night_pixels,
+            'save_as_npy': save_as_npy,
+            'output_format': output_format,
+            'store': None,
+            'enhance_img': enhance_img,
+            'stretch': running_stretch,
+            'crop': crop or low_memory,
+            'download_retries': download_retries,
+            'manifest': OutputManifest(output_path),
+            'failures': []
+        }
+        run['targets'] = self._run_targets(run, channels)
+        run['area_defs'] = list(dict.fromkeys(self._target_area(target) for target in run['targets']))
+        return run
+
+    def _search_products(self, dtstart, dtend, run):
+        if self.catalog is not None:
+            products = self.catalog.search(self.selected_collection, self.datastore, dtstart, dtend)
+        else:
+            products = list(self.selected_collection.search(dtstart=dtstart, dtend=dtend))
+        latest = max(filter(None, map(product_sensing_time, products)), default=None)
+        with self._search_lock:
+            if latest is not None and (self.latest_sensing_time is None or latest > self.latest_sensing_time):
+                self.latest_sensing_time = latest
+        print(f"Found {len(products)} matching timestep(s).")
+        # Oldest first, so the timesteps are written (and appended to the stores) in time order
+        products = sorted(products, key=lambda p: product_sensing_time(p) or datetime.datetime.min)
+        # If no start datetime is provided, retrieve the most recent product available
+        if self.last_picture and products:
+            products = [max(products, key=lambda p: product_sensing_time(p) or datetime.datetime.min)]
+        # === SKIP IF THE SUN ANGLE IS BELOW A CERTAIN THRESHOLD ===
+        if run['skip_night_angle'] is not None:
+            products = self._filter_daylight(products, run['skip_night_angle'], run['area_defs'], run['sun_sampling'])
+        return products
+
+    def _write_timestep(self, job, run):
+        ts_dt, output_path = job['ts_dt'], run['output_path']
+        try:
+            for target, img in job['images']:
+                try:
+                    file_name = output_filename(self.satellite, target, ts_dt, run)
+                    if run['stretch'] is not None:
+                        img = run['stretch']((target['channel'], target['region']), img)
+                    if run['store'] is not None:
+                        file_name = os.path.basename(run['store'].store_path(target, run))
+                        if run['store'].contains(target, ts_dt, run):
+                            print(f"{ts_dt.strftime('%Y%m%dT%H%M%S')} already in {file_name}. Skipping.")
+                            run['manifest'].add(self.satellite, target, ts_dt, run, file_name)
+                            continue
+                        store = run['store'].append(target, ts_dt, img, self._target_area(target), run)
+                        print(f"Appended to {os.path.basename(store)}  shape={img.shape} dtype={img.dtype}")
+                    elif run['save_as_npy']:
+                        np.save(os.path.join(output_path, file_name), img)
+                        print(f'Saved at {output_path}')
+                        print(f"Saved array: {file_name}  shape={img.shape} dtype={img.dtype}")
+                    else:
+                        cv2.imwrite(os.path.join(output_path, file_name), img)
+                        print(f'Saved at {output_path}')
+                        print(f"Saved image: {file_name}")
+                    run['manifest'].add(self.satellite, target, ts_dt, run, file_name)
+                except Exception as e:
+                    print(f"Error processing scene: {e}")
+                    record_failure(run, ts_dt, 'write', e)
+        finally:
+            self._remove_files(job['files'])
+        print('====================================================')
+
+    def backfill(self, start_date, end_date, window_hours=24, checkpoint_path=None, retry_failed=True, **kwargs):
+        # get_image over [start_date, end_date] in checkpointed windows; see run_backfill
+        return run_backfill(self.satellite, self.get_image, start_date, end_date, window_hours, checkpoint_path, retry_failed, **kwargs)
+
+    def daemon(self, start_date=None, end_date=None, poll_minutes=None, lookback_minutes=None, max_polls=None, **kwargs):
+        # get_image every poll_minutes over the products published since the previous poll; see run_daemon
+        if poll_minutes is None:
+            poll_minutes = self.default_poll_minutes
+        return run_daemon(self.satellite, self.get_image, lambda: self.latest_sensing_time, poll_minutes, start_date, end_date, lookback_minutes, max_polls, **kwargs)
+
+    async def get_images(self, start_date, end_date, window_hours=24, max_searches=4, max_downloads=4, process_workers=1, memory_budget_mb=2048, **kwargs):
+        # asyncio front-end: the searches of the windows of [start_date, end_date] run
+        # concurrently and their products are downloaded, processed and written as they
+        # come (see run_async_pipeline). kwargs are the output and area arguments of get_image.
+        start = time.time()
+        dtstart = datetime.datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%S")
+        dtend = datetime.datetime.strptime(end_date, "%Y-%m-%dT%H:%M:%S")
+        self.last_picture = False
+        run = self._prepare_run(**kwargs)
+        run['store'] = get_output_store(run['output_format'], run['output_path'], self.satellite)
+        searches = [functools.partial(self._search_products, window_start, window_end, run)
+                    for window_start, window_end in backfill_windows(dtstart, dtend, window_hours)]
+
+        dask_config = low_memory_dask_config(memory_budget_mb / process_workers) if kwargs.get('low_memory') else {}
+        with self._downloader(run) as download_timestep, dask.config.set(dask_config):
+            await run_async_pipeline(searches,
+                                     download_timestep,
+                                     lambda job: self._process_timestep(job, run),
+                                     lambda job: self._write_timestep(job, run),
+                                     max_searches=max_searches,
+                                     max_downloads=max_downloads,
+                                     process_workers=process_workers)
+
+        report_failures(run['failures'])
+        print(f'Ended execution at: {datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")}. It took {time.time() - start:.2f} seconds.')
+        return run['failures']
@@ -0,0 +1,171 @@
+import os
+import json
+import sqlite3
+import datetime
+import threading
+from EumetSat_utils import product_sensing_time
+
+# ========== PRODUCT CATALOG ==========
+# SQLite file recording, per collection, the products returned by Data Store searches
+# (id, sensing start/end and entry names) and the time intervals already searched.
+# A search only queries the Data Store for the parts of the range not covered yet and
+# answers the rest locally, so repeated backfills over the same period and the entry
+# filtering of every timestep read local data. An interval only counts as covered up
+# to CATALOG_SETTLE before the time it was searched, since products may still be
+# published after that; searches of recent times always go to the Data Store.
+
+CATALOG_SETTLE = datetime.timedelta(hours=1)
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    collection TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    sensing_start TEXT NOT NULL,
+    sensing_end TEXT NOT NULL,
+    entries TEXT NOT NULL,
+    PRIMARY KEY (collection, product_id)
+);
+CREATE INDEX IF NOT EXISTS products_time ON products (collection, sensing_start);
+CREATE TABLE IF NOT EXISTS coverage (
+    collection TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL
+);
+"""
+
+
+def _utc_naive(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _to_text(dt):
+    return dt.strftime(TIME_FORMAT)
+
+
+def _from_text(text):
+    return datetime.datetime.strptime(text, TIME_FORMAT)
+
+
+class CatalogProduct:
+    # Catalog row with the attributes of an eumdac Product used by the classes; the
+    # Data Store product is only created to download it
+    def __init__(self, datastore, collection_id, product_id, sensing_start, sensing_end, entries):
+        self.datastore = datastore
+        self.collection_id = collection_id
+        self.product_id = product_id
+        self.sensing_start = sensing_start
+        self.sensing_end = sensing_end
+        self.entries = tuple(entries)
+        self._product = None
+
+    def __str__(self):
+        return self.product_id
+
+    def __repr__(self):
+        return f"CatalogProduct({self.collection_id}, {self.product_id})"
+
+    def open(self, entry=None, chunk=None, **kwargs):
+        if self._product is None:
+            self._product = self.datastore.get_product(self.collection_id, self.product_id)
+        return self._product.open(entry=entry, chunk=chunk, **kwargs)
+
+
+class ProductCatalog:
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def _gaps(self, collection_id, dtstart, dtend):
+        rows = self._db.execute(
+            "SELECT start, end FROM coverage WHERE collection = ? AND end >= ? AND start <= ? ORDER BY start",
+            (collection_id, _to_text(dtstart), _to_text(dtend))
+        ).fetchall()
+        gaps = []
+        cursor = dtstart
+        for start, end in rows:
+            start, end = _from_text(start), _from_text(end)
+            if start > cursor:
+                gaps.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < dtend:
+            gaps.append((cursor, dtend))
+        return gaps
+
+    def _add_coverage(self, collection_id, start, end):
+        # Merges the interval with the ones it overlaps or touches
+        rows = self._db.execute(
+            "SELECT rowid, start, end FROM coverage WHERE collection = ? AND end >= ? AND start <= ?",
+            (collection_id, _to_text(start), _to_text(end))
+        ).fetchall()
+        for rowid, row_start, row_end in rows:
+            start = min(start, _from_text(row_start))
+            end = max(end, _from_text(row_end))
+            self._db.execute("DELETE FROM coverage WHERE rowid = ?", (rowid,))
+        self._db.execute("INSERT INTO coverage VALUES (?, ?, ?)", (collection_id, _to_text(start), _to_text(end)))
+
+    def _add_products(self, collection_id, products):
+        rows = []
+        for product in products:
+            sensing_start = product_sensing_time(product)
+            if sensing_start is None:
+                continue
+            try:
+                sensing_end = _utc_naive(product.sensing_end or sensing_start)
+            except Exception:
+                sensing_end = sensing_start
+            rows.append((collection_id, str(product), _to_text(sensing_start), _to_text(sensing_end), json.dumps(list(product.entries))))
+        self._db.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)", rows)
+
+    def search(self, collection, datastore, dtstart, dtend):
+        # Products of the collection sensed over [dtstart, dtend], most recent first as
+        # the Data Store returns them
+        collection_id = str(collection)
+        dtstart, dtend = _utc_naive(dtstart), _utc_naive(dtend)
+        settled = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - CATALOG_SETTLE
+        with self._lock:
+            gaps = self._gaps(collection_id, dtstart, dtend)
+        searched = {}
+        for gap_start, gap_end in gaps:
+            products = list(collection.search(dtstart=gap_start, dtend=gap_end))
+            searched.update((str(product), product) for product in products)
+            with self._lock, self._db:
+                self._add_products(collection_id, products)
+                if min(gap_end, settled) > gap_start:
+                    self._add_coverage(collection_id, gap_start, min(gap_end, settled))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT product_id, sensing_start, sensing_end, entries FROM products "
+                "WHERE collection = ? AND (sensing_end > ? OR sensing_start >= ?) AND sensing_start <= ? ORDER BY sensing_start DESC",
+                (collection_id, _to_text(dtstart), _to_text(dtstart), _to_text(dtend))
+            ).fetchall()
+        if gaps:
+            local = sum(1 for row in rows if row[0] not in searched)
+            print(f"[INFO] Catalog: searched {len(gaps)} uncovered interval(s), {local} product(s) found locally")
+        else:
+            print(f"[INFO] Catalog: {len(rows)} product(s) found locally")
+        # Products just returned by the Data Store are kept as they are
+        return [searched.get(product_id) or CatalogProduct(datastore, collection_id, product_id, _from_text(start), _from_text(end), json.loads(entries))
+                for product_id, start, end, entries in rows]
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(path=None):
+    path = path or os.environ.get('EUMETSAT_CATALOG')
+    if path is None:
+        return None
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = ProductCatalog(path)
+        return _catalogs[path]
@@ -0,0 +1,206 @@
+import os
+import datetime
+
+# ========== RUN OPTIONS ==========
+# Names and choices shared by the classes and the executables. This module only uses
+# the standard library, so the executables can validate their arguments, list the
+# channels and regions and plan a run before the heavy imports (satpy, pyresample,
+# cv2, skyfield, shapely, eumdac).
+
+REGION_EXTENTS = {
+    'balearic_islands': [1.0, 38.5, 4.5, 40.27],
+    'iberia': [-10.0, 35.0, 4.5, 44.5],
+    'france': [-5.5, 41.0, 9.5, 51.5],
+    'uk_ireland': [-11.0, 49.5, 3.5, 60.0],
+    'germany_benelux': [2.5, 47.0, 14.5, 55.0],
+    'scandinavia': [5.0, 55.0, 25.0, 71.5],
+    'italy': [6.0, 36.0, 19.0, 47.0],
+    'greece': [19.0, 34.5, 29.5, 42.5],
+    'balkans': [13.0, 36.0, 30.0, 47.5]
+}
+
+# Channel (or composite) -> resolution in meters per pixel
+MSG_RESOLUTIONS = {
+    'HRV': 1000,
+    'IR_016': 3000,
+    'IR_039': 3000,
+    'IR_087': 3000,
+    'IR_097': 3000,
+    'IR_108': 3000,
+    'IR_120': 3000,
+    'IR_134': 3000,
+    'VIS006': 3000,
+    'VIS008': 3000,
+    'WV_062': 3000,
+    'WV_073': 3000
+}
+
+MSG_RESOLUTIONS.update({
+    '24h_microphysics': 3000,
+    'airmass': 3000,
+    'ash': 3000,
+    'cloud_phase_distinction': 3000,
+    'cloud_phase_distinction_raw': 3000,
+    'cloudtop': 3000,
+    'cloudtop_daytime': 3000,
+    'colorized_ir_clouds': 3000,
+    'convection': 3000,
+    'day_microphysics': 3000,
+    'day_microphysics_winter': 3000,
+    'day_severe_storms': 3000,
+    'day_severe_storms_tropical': 3000,
+    'dust': 3000,
+    'fog': 3000,
+    'green_snow': 3000,
+    'hrv_clouds': 1000,
+    'hrv_fog': 1000,
+    'hrv_severe_storms': 1000,
+    'hrv_severe_storms_masked': 1000,
+    'ir108_3d': 3000,
+    'ir_cloud_day': 3000,
+    'ir_overview': 3000,
+    'ir_sandwich': 3000,
+    'natural_color': 3000,
+    'natural_color_nocorr': 3000,
+    'natural_color_raw': 3000,
+    'natural_color_raw_with_night_ir': 3000,
+    'natural_color_with_night_ir': 3000,
+    'natural_color_with_night_ir_hires': 3000,
+    'natural_enh': 3000,
+    'natural_enh_with_night_ir': 3000,
+    'natural_enh_with_night_ir_hires': 3000,
+    'natural_with_night_fog': 3000,
+    'night_fog': 3000,
+    'night_ir_alpha': 3000,
+    'night_ir_with_background': 3000,
+    'night_ir_with_background_hires': 3000,
+    'night_microphysics': 3000,
+    'night_microphysics_tropical': 3000,
+    'overshooting_tops': 3000,
+    'overview': 3000,
+    'overview_raw': 3000,
+    'realistic_colors': 3000,
+    'rocket_plume_day': 3000,
+    'rocket_plume_night': 3000,
+    'snow': 3000,
+    'vis_sharpened_ir': 3000
+})
+
+MTG_RESOLUTIONS = {'vis_06':500, 'nir_22':500, 'ir_38':1000, 'ir_105':1000}
+
+# Minutes between two products of each collection
+CADENCE_MINUTES = {'MSG': 5, 'MTG': 10}
+
+OUTPUT_FORMATS = ('jpg', 'npy', 'zarr', 'memmap')
+SUN_SAMPLINGS = ('center', 'corners', 'pixels')
+STRETCH_MODES = ('frame', 'running')
+PIPELINE_MODES = ('sequential', 'pipeline')
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Region used when neither a country nor a custom bounding box is given
+DEFAULT_COUNTRY = 'iberia'
+
+
+def select_countries(country, lat_min, lat_max, lon_min, lon_max):
+    # Lower-cased list of the requested countries, empty for a custom bounding box
+    countries = [country] if isinstance(country, str) else list(country or [])
+    countries = [c.lower() for c in countries]
+    use_custom_roi = all(v is not None for v in [lat_min, lat_max, lon_min, lon_max])
+    if use_custom_roi and countries:
+        raise ValueError('Mixture of predefined country and customs areas found. Pick one please.')
+    if not use_custom_roi and not countries:
+        countries = [DEFAULT_COUNTRY]
+    return countries
+
+
+# ========== LISTING / DRY RUN ==========
+
+def print_channels(resolutions):
+    print("Channel Name".ljust(35), "Resolution (m/px)")
+    print("-" * 50)
+    for channel, res in sorted(resolutions.items()):
+        print(channel.ljust(35), res)
+
+def print_regions():
+    print("Region".ljust(20), "Extent (lon_min, lat_min, lon_max, lat_max)")
+    print("-" * 65)
+    for region, extent in REGION_EXTENTS.items():
+        print(region.ljust(20), tuple(extent))
+
+def _parse_date(name, value):
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}. Format must be YYYY-MM-DDTHH:MM:SS")
+
+def plan_run(satellite, resolutions, channels, country, lat_min, lat_max, lon_min, lon_max,
+             start_date=None, end_date=None, output_path=None, output_format=None, save_as_npy=False,
+             window_hours=None, daemon=False, poll_minutes=None):
+    # Checks the arguments the way get_image does and returns a summary of the run,
+    # without credentials, network access or heavy imports; raises ValueError, which
+    # the executables report as usage errors
+    channels = [channels] if isinstance(channels, str) else list(channels)
+    unknown = [ch for ch in channels if ch not in resolutions]
+    if unknown:
+        raise ValueError(f"Invalid channel(s): {unknown}. Use --list_channels to see the available ones")
+    countries = select_countries(country, lat_min, lat_max, lon_min, lon_max)
+    for c in countries:
+        if c not in REGION_EXTENTS:
+            raise ValueError(f"Invalid country: {c}. Choose from: {list(REGION_EXTENTS.keys())}")
+    regions = countries or ['custom_area']
+    output_format = output_format or ('npy' if save_as_npy else 'jpg')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Invalid output_format: {output_format}. Choose from: {list(OUTPUT_FORMATS)}")
+
+    start = _parse_date('start_date', start_date) if start_date else None
+    end = _parse_date('end_date', end_date) if end_date else None
+    if start is not None and end is not None and start >= end:
+        raise ValueError(f"start_date {start_date} must be before end_date {end_date}")
+    cadence = CADENCE_MINUTES[satellite]
+    if window_hours is not None and window_hours <= 0:
+        raise ValueError(f"Invalid window_hours: {window_hours}. Must be positive")
+    if daemon and poll_minutes is not None and poll_minutes <= 0:
+        raise ValueError(f"Invalid poll_minutes: {poll_minutes}. Must be positive")
+    if daemon:
+        mode = f"daemon, polling every {poll_minutes or cadence} minute(s)" + (f" until {end_date}" if end else "")
+    elif start is None or end is None:
+        mode = "latest picture"
+    elif window_hours is not None:
+        windows = -(-(end - start) // datetime.timedelta(hours=window_hours))
+        mode = f"backfill in {windows} window(s) of {window_hours} hour(s)"
+    else:
+        mode = "date range"
+    timesteps = None
+    if start is not None and end is not None and not daemon:
+        timesteps = int((end - start).total_seconds() // (cadence * 60)) + 1
+    elif start is None and end is None and not daemon:
+        timesteps = 1
+    outputs_per_timestep = len(channels) * len(regions)
+    return {
+        'satellite': satellite,
+        'mode': mode,
+        'start_date': start_date,
+        'end_date': end_date,
+        'channels': channels,
+        'regions': regions,
+        'output_path': output_path or os.path.join(os.getcwd(), 'imgs'),
+        'output_format': output_format,
+        'timesteps': timesteps,
+        'outputs': timesteps * outputs_per_timestep if timesteps is not None else None,
+        'outputs_per_timestep': outputs_per_timestep
+    }
+
+def print_plan(plan):
+    print(f"Dry run ({plan['satellite']}): nothing is downloaded")
+    print(f"  Mode:          {plan['mode']}")
+    if plan['start_date'] or plan['end_date']:
+        print(f"  Dates:         {plan['start_date'] or '-'} -> {plan['end_date'] or '-'}")
+    print(f"  Channels:      {', '.join(plan['channels'])}")
+    print(f"  Regions:       {', '.join(plan['regions'])}")
+    print(f"  Output:        {plan['output_format']} in {plan['output_path']}")
+    if plan['timesteps'] is not None:
+        print(f"  Timesteps:     up to {plan['timesteps']} (before the night and already-done filters)")
+        print(f"  Outputs:       up to {plan['outputs']}")
+    else:
+        print(f"  Outputs:       {plan['outputs_per_timestep']} per timestep")
@@ -0,0 +1,170 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import eumdac.request as eumdac_request
+from eumdac import DataStore, AccessToken
+from eumdac.token import HTTPBearerAuth
+
+# ========== SHARED SESSION ==========
+# One access token and DataStore per set of credentials in a process, shared by every
+# EumetSatMSG/EumetSatMTG instance. The token is renewed TOKEN_REFRESH_MARGIN seconds
+# before it expires, so multi-hour runs never send an expired one.
+#
+# eumdac opens a new requests.Session for every call, so nothing is pooled. Once a
+# shared DataStore is created, eumdac's request function is replaced by one going
+# through a persistent session per thread (keep-alive connections are reused across
+# searches, downloads and timesteps), retrying 5xx responses and connection errors
+# with exponential backoff, and retrying a 401 once with a renewed token. eumdac's
+# handling of throttled (429) responses is kept.
+#
+# Both rely on private parts of eumdac (checked against 3.x): when they are missing,
+# eumdac's own AccessToken and request function are used instead.
+
+TOKEN_REFRESH_MARGIN = 300  # seconds
+TOKEN_RENEWAL_INTERVAL = 30  # seconds between two renewals while the token is valid
+HTTP_RETRIES = 5
+HTTP_BACKOFF = 1.0  # seconds, doubled at every retry
+HTTP_POOL_SIZE = 8  # connections kept per host and thread
+
+
+class SharedAccessToken(AccessToken):
+    # eumdac's AccessToken only renews a token in its last seconds and is not thread
+    # safe; this one renews it ahead of time, once, under a lock. The server may hand
+    # back the same token until it expires, so while it is still valid a renewal is
+    # only attempted every TOKEN_RENEWAL_INTERVAL seconds
+    def __init__(self, credentials, refresh_margin=TOKEN_REFRESH_MARGIN, **kwargs):
+        super().__init__(credentials, **kwargs)
+        self.refresh_margin = refresh_margin
+        self._previous_token = ''
+        self._last_renewal = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def access_token(self):
+        with self._lock:
+            now = time.time()
+            expires_in = self._expiration - now
+            if expires_in < self.refresh_margin and (expires_in <= 0 or now - self._last_renewal >= TOKEN_RENEWAL_INTERVAL):
+                self._last_renewal = now
+                try:
+                    previous_token = self._access_token
+                    self._update_token_data()
+                    if self._access_token != previous_token:
+                        self._previous_token = previous_token
+                except Exception as e:
+                    if expires_in <= 0:
+                        raise
+                    # Keep using the current token while it is valid
+                    print(f"[WARN] Token renewal failed ({e}); the current token expires in {int(expires_in)} s")
+            return self._access_token
+
+    def issued(self, value):
+        return bool(value) and value in (self._access_token, self._previous_token)
+
+    def invalidate(self, value):
+        # Renew at the next use, unless another thread already replaced this value
+        with self._lock:
+            if value == self._access_token:
+                self._expiration = 0
+
+
+_tokens = {}
+_datastores = {}
+_registry_lock = threading.Lock()
+
+
+def get_token(consumer_key, consumer_secret):
+    with _registry_lock:
+        credentials = (consumer_key, consumer_secret)
+        if credentials not in _tokens:
+            token = SharedAccessToken(credentials)
+            if not all(hasattr(token, name) for name in ('_expiration', '_access_token', '_update_token_data')):
+                print("[WARN] Unsupported eumdac version: the token is renewed by eumdac itself")
+                token = AccessToken(credentials)
+            _tokens[credentials] = token
+        return _tokens[credentials]
+
+
+def get_datastore(consumer_key, consumer_secret):
+    token = get_token(consumer_key, consumer_secret)
+    with _registry_lock:
+        if token not in _datastores:
+            install_pooled_requests()
+            _datastores[token] = DataStore(token)
+        return _datastores[token]
+
+
+# ========== POOLED REQUESTS ==========
+
+_http_local = threading.local()
+
+
+def _http_session():
+    # requests.Session is not guaranteed thread safe, so every thread keeps its own
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        retry = Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=HTTP_BACKOFF,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["HEAD", "GET", "OPTIONS", "POST", "PUT", "PATCH"],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_local.session = session
+    return session
+
+
+def _token_for_auth(auth):
+    if not isinstance(auth, HTTPBearerAuth):
+        return None
+    for token in list(_tokens.values()):
+        if isinstance(token, SharedAccessToken) and token.issued(auth.token):
+            return token
+    return None
+
+
+def _should_retry(response):
+    try:
+        return eumdac_request._should_retry(response)
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+def pooled_request(method, url, max_retries=None, backoff_factor=None, **kwargs):
+    # Same signature and behaviour as eumdac.request._request (the retry settings
+    # are the ones of the pooled session)
+    session = _http_session()
+    reauthorized = False
+    while True:
+        try:
+            response = session.request(method.upper(), url, **kwargs)
+        except requests.exceptions.RetryError:
+            raise eumdac_request.RequestError(f"Maximum retries ({HTTP_RETRIES}) reached for {method.capitalize()} {url}")
+        if response.status_code == 401 and not reauthorized:
+            token = _token_for_auth(kwargs.get('auth'))
+            if token is not None:
+                print("[WARN] Request unauthorized, retrying with a renewed token")
+                response.close()
+                token.invalidate(kwargs['auth'].token)
+                kwargs['auth'] = token.auth
+                reauthorized = True
+                continue
+        if _should_retry(response):
+            response.close()
+            continue
+        return response
+
+
+def install_pooled_requests():
+    # eumdac's get/post/... look _request up in eumdac.request at every call
+    if not all(hasattr(eumdac_request, name) for name in ('_request', '_should_retry', 'RequestError')):
+        print("[WARN] Unsupported eumdac version: HTTP connections are not pooled")
+        return False
+    eumdac_request._request = pooled_request
+    return True
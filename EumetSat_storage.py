@@ -0,0 +1,330 @@
+import os
+import json
+import threading
+import numpy as np
+from EumetSat_utils import solar_elevation_grid, region_label
+from EumetSat_options import OUTPUT_FORMATS
+
+# ========== OUTPUT FORMATS ==========
+# jpg: one enhanced image per timestep and target
+# npy: one raw array per timestep and target
+# zarr: raw frames appended to one chunked, compressed datacube per target
+# memmap: raw frames written into one preallocated memory-mappable .npy per target,
+#         plus a .index.npy of timestamps, sun elevation and valid pixel fraction
+
+def get_output_store(output_format, output_path, satellite, capacity=0):
+    # Per-target store for the formats that gather every timestep in one file, None for jpg/npy
+    if output_format == 'zarr':
+        return DatacubeWriter(output_path, satellite)
+    if output_format == 'memmap':
+        return MemmapWriter(output_path, satellite, capacity=capacity)
+    return None
+
+
+# ========== OUTPUT MANIFEST ==========
+# manifest.jsonl in the output folder records every finished (satellite, channel,
+# region, timestamp, output format) output, one JSON line each, and is read once at
+# start instead of listing the folder. When it does not exist yet, the files already
+# in the folder are indexed into it once by name, so outputs of earlier runs are
+# still matched by file name (any case), as the folder listing did.
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+class OutputManifest:
+    def __init__(self, output_path):
+        self.path = os.path.join(output_path, MANIFEST_NAME)
+        self._done = set()
+        self._stems = set()
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            self._load()
+        else:
+            self._bootstrap(output_path)
+
+    @staticmethod
+    def key(satellite, target, ts_dt, run):
+        return (satellite, target['channel'], region_label(target, run), ts_dt.strftime('%Y-%m-%dT%H:%M:%S'), run['output_format'])
+
+    def _remember(self, record):
+        if 'time' in record:
+            self._done.add((record['satellite'], record['channel'], record['region'], record['time'], record['format']))
+        if 'file' in record:
+            self._stems.add(os.path.splitext(record['file'])[0].lower())
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self._remember(json.loads(line))
+                except (ValueError, KeyError):
+                    # A line cut short by an interrupted run
+                    continue
+
+    def _bootstrap(self, output_path):
+        names = [entry.name for entry in os.scandir(output_path)
+                 if entry.name != MANIFEST_NAME and not entry.name.endswith('.part')]
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for name in names:
+                record = {'file': name}
+                f.write(json.dumps(record) + '\n')
+                self._remember(record)
+        if names:
+            print(f"[INFO] Indexed {len(names)} existing output(s) into {MANIFEST_NAME}")
+
+    def contains(self, satellite, target, ts_dt, run, file_name=None):
+        with self._lock:
+            if self.key(satellite, target, ts_dt, run) in self._done:
+                return True
+            return file_name is not None and os.path.splitext(file_name)[0].lower() in self._stems
+
+    def add(self, satellite, target, ts_dt, run, file_name):
+        key = self.key(satellite, target, ts_dt, run)
+        record = dict(zip(('satellite', 'channel', 'region', 'time', 'format'), key), file=file_name)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+            self._remember(record)
+
+
+# ========== TARGET STORES ==========
+# One store per (channel, region) target, named <satellite>_<channel>_<region><extension>.
+# The timestamps already stored are read once and kept in memory so that reruns
+# skip them without reopening the store for every timestep.
+
+class TargetStore:
+    extension = ''
+
+    def __init__(self, output_path, satellite):
+        self.output_path = output_path
+        self.satellite = satellite
+        self._times = {}
+        self._lock = threading.Lock()
+
+    def store_path(self, target, run):
+        return os.path.join(self.output_path, f"{self.satellite}_{target['channel']}_{region_label(target, run)}{self.extension}")
+
+    def _read_times(self, path):
+        raise NotImplementedError
+
+    def times(self, target, run):
+        path = self.store_path(target, run)
+        if path not in self._times:
+            self._times[path] = self._read_times(path) if os.path.exists(path) else set()
+        return self._times[path]
+
+    def contains(self, target, ts_dt, run):
+        with self._lock:
+            return np.datetime64(ts_dt, 's') in self.times(target, run)
+
+
+# ========== ZARR DATACUBE ==========
+# Each (channel, region) target gets a <satellite>_<channel>_<region>.zarr store
+# holding a (time, y, x[, band]) variable named after the channel, with time,
+# latitude (y) and longitude (x) coordinates. Frames are appended one at a time
+# along time, so the series is never held in memory; every frame is its own
+# chunk along time and is tiled spatially into chunk_size blocks. The time axis only
+# increases: a frame older than the last stored one (e.g. a timestep retried after a
+# failure) is inserted at its place by rewriting the frames after it.
+
+class DatacubeWriter(TargetStore):
+    extension = '.zarr'
+
+    def __init__(self, output_path, satellite, chunk_size=512):
+        try:
+            import zarr  # noqa: F401  (required by xarray's to_zarr)
+        except ImportError:
+            raise ImportError("output_format='zarr' requires the zarr package: pip install zarr")
+        super().__init__(output_path, satellite)
+        self.chunk_size = chunk_size
+
+    def _read_times(self, path):
+        import xarray as xr
+        with xr.open_zarr(path) as ds:
+            return set(ds['time'].values.astype('datetime64[s]'))
+
+    def append(self, target, ts_dt, img, area_def, run):
+        import xarray as xr
+        channel = target['channel']
+        # Pixel centres over the area extent; the image may have been resized (MTG width)
+        lon_min, lat_min, lon_max, lat_max = area_def.area_extent
+        height, width = img.shape[:2]
+        lons = lon_min + (np.arange(width) + 0.5) * (lon_max - lon_min) / width
+        lats = lat_max - (np.arange(height) + 0.5) * (lat_max - lat_min) / height
+        dims = ('time', 'y', 'x', 'band')[:img.ndim + 1]
+        ds = xr.Dataset(
+            {channel: (dims, img[np.newaxis])},
+            coords={
+                'time': [np.datetime64(ts_dt, 'ns')],
+                'y': ('y', lats, {'standard_name': 'latitude', 'units': 'degrees_north'}),
+                'x': ('x', lons, {'standard_name': 'longitude', 'units': 'degrees_east'})
+            },
+            attrs={'satellite': self.satellite, 'channel': channel, 'region': str(target['region'])}
+        )
+        with self._lock:
+            path = self.store_path(target, run)
+            times = self.times(target, run)
+            ts = np.datetime64(ts_dt, 's')
+            if not os.path.exists(path):
+                chunks = (1, min(height, self.chunk_size), min(width, self.chunk_size)) + img.shape[2:]
+                ds.to_zarr(path, mode='w-', encoding={channel: {'chunks': chunks}, 'time': {'units': 'seconds since 1970-01-01', 'dtype': 'int64'}})
+            elif not times or ts > max(times):
+                ds.to_zarr(path, append_dim='time')
+            else:
+                self._insert(path, ds, ts)
+            times.add(ts)
+        return path
+
+    def _insert(self, path, ds, ts):
+        import xarray as xr
+        with xr.open_zarr(path) as stored:
+            stored_times = stored['time'].values.astype('datetime64[s]')
+            position = int(np.searchsorted(stored_times, ts))
+            tail = stored.isel(time=slice(position, None)).load()
+        count = len(stored_times)
+        # Grow the cube by its last frame, then shift the frames from position on by one
+        # and write the new one in front of them (time chunks are one frame each). Region
+        # writes leave the time index alone, so its values are written through zarr
+        tail.isel(time=[-1]).to_zarr(path, append_dim='time')
+        shifted = xr.concat([ds, tail.isel(time=slice(0, -1))], dim='time', data_vars='all')
+        shifted.drop_vars(['time', 'y', 'x']).to_zarr(path, region={'time': slice(position, count)})
+        import zarr
+        seconds = np.concatenate([[ts], stored_times[position:]]).astype('int64')
+        zarr.open_group(path, mode='r+')['time'][position:] = seconds
+        print(f"[INFO] Inserted {str(ts)} before {count - position} later frame(s) of {os.path.basename(path)}")
+
+
+# ========== MEMORY-MAPPED DATASET ==========
+# <satellite>_<channel>_<region>.npy holds a (capacity, H, W[, bands]) array, preallocated
+# for the timesteps of the run, and <...>.index.npy the records of the frames written so
+# far (only the first len(index) frames are valid). A frame is flushed before the index
+# is atomically replaced, so an interrupted run never indexes a partial frame. When full,
+# the array grows by the run's capacity or doubles, whichever is larger, so a rerun
+# grows it once and a run of unknown length (capacity 0) a logarithmic number of times.
+# Frames are kept in time order: one older than the last indexed frame is inserted at
+# its place in a rewritten copy of the array.
+
+INDEX_DTYPE = np.dtype([('time', 'datetime64[s]'), ('sun_elevation', 'float32'), ('valid_fraction', 'float32')])
+
+
+def index_path(data_path):
+    return os.path.splitext(data_path)[0] + '.index.npy'
+
+
+class MemmapWriter(TargetStore):
+    extension = '.npy'
+
+    def __init__(self, output_path, satellite, capacity=0):
+        super().__init__(output_path, satellite)
+        self.capacity = max(int(capacity), 1)
+        self._indexes = {}
+
+    def _read_times(self, path):
+        return set(self._index(path)['time'])
+
+    def _index(self, path):
+        if path not in self._indexes:
+            idx_path = index_path(path)
+            self._indexes[path] = np.load(idx_path) if os.path.exists(idx_path) else np.empty(0, dtype=INDEX_DTYPE)
+        return self._indexes[path]
+
+    def _allocate(self, path, frame_shape, dtype, count, position=None):
+        # Returns a writable memmap with room for frame count, copying the first count
+        # frames of an existing full array into a larger one. With a position before
+        # count, the copy leaves frame position free and moves the later frames up by one
+        if not os.path.exists(path):
+            return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(self.capacity,) + frame_shape)
+        data = np.load(path, mmap_mode='r+')
+        if data.shape[1:] != frame_shape:
+            raise ValueError(f"Frame shape {frame_shape} does not match {os.path.basename(path)} {data.shape[1:]}")
+        if position is None or position >= count:
+            if count < data.shape[0]:
+                return data
+            position = count
+        tmp_path = path + '.part'
+        length = data.shape[0] if count < data.shape[0] else count + max(self.capacity, count)
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=data.dtype, shape=(length,) + frame_shape)
+        for start in range(0, count, 64):
+            stop = min(start + 64, count)
+            if stop <= position:
+                grown[start:stop] = data[start:stop]
+            elif start >= position:
+                grown[start + 1:stop + 1] = data[start:stop]
+            else:
+                grown[start:position] = data[start:position]
+                grown[position + 1:stop + 1] = data[position:stop]
+        grown.flush()
+        del data, grown
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r+')
+
+    def append(self, target, ts_dt, img, area_def, run):
+        lons, lats = area_def.get_lonlats(data_slice=(np.asarray([area_def.shape[0] // 2]), np.asarray([area_def.shape[1] // 2])))
+        record = np.array([(np.datetime64(ts_dt, 's'),
+                            float(np.ravel(solar_elevation_grid(ts_dt, lats, lons))[0]),
+                            float(np.isfinite(img).mean()) if np.issubdtype(img.dtype, np.floating) else 1.0)],
+                          dtype=INDEX_DTYPE)
+        with self._lock:
+            path = self.store_path(target, run)
+            times = self.times(target, run)
+            index = self._index(path)
+            position = int(np.searchsorted(index['time'], record['time'][0]))
+            data = self._allocate(path, img.shape, img.dtype, len(index), position)
+            data[position] = img
+            data.flush()
+            del data
+            if position < len(index):
+                print(f"[INFO] Inserted {str(record['time'][0])} before {len(index) - position} later frame(s) of {os.path.basename(path)}")
+            index = np.concatenate([index[:position], record, index[position:]])
+            tmp_path = index_path(path) + '.part'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, index)
+            os.replace(tmp_path, index_path(path))
+            self._indexes[path] = index
+            times.add(record['time'][0])
+        return path
+
+
+class MemmapDataset:
+    # Read side for data loaders: dataset[i] is a zero-copy view of frame i (fancy
+    # indexing copies, as with any numpy array). Pass min_valid_fraction/min_sun_elevation
+    # to only expose the frames whose index record passes them.
+    def __init__(self, path, min_valid_fraction=0.0, min_sun_elevation=None):
+        if not path.endswith('.npy'):
+            path = path + '.npy'
+        self.path = path
+        index = np.load(index_path(path))
+        data = np.load(path, mmap_mode='r')
+        keep = index['valid_fraction'] >= min_valid_fraction
+        if min_sun_elevation is not None:
+            keep &= index['sun_elevation'] >= min_sun_elevation
+        self.positions = np.flatnonzero(keep)
+        self.index = index[self.positions]
+        # Contiguous selections keep basic slicing (and views) for batches
+        if len(self.positions) == len(index):
+            self.data = data[:len(index)]
+        else:
+            self.data = None
+            self._data = data
+
+    @property
+    def times(self):
+        return self.index['time']
+
+    @property
+    def frame_shape(self):
+        return (self.data if self.data is not None else self._data).shape[1:]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, item):
+        if self.data is not None:
+            return self.data[item]
+        positions = self.positions[item]
+        if np.ndim(positions) == 0:
+            return self._data[positions]
+        return self._data[np.asarray(positions)]
+
+    def __repr__(self):
+        return f"MemmapDataset({os.path.basename(self.path)}, frames={len(self)}, frame_shape={self.frame_shape})"
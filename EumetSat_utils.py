@@ -0,0 +1,1094 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import urllib.request
+import datetime
+import threading
+import queue
+import asyncio
+from multiprocessing.util import Finalize
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
+import dask
+from pyproj import Transformer
+from pyresample import create_area_def
+from skyfield.api import Loader, load_file, wgs84
+from EumetSat_options import REGION_EXTENTS, SUN_SAMPLINGS, STRETCH_MODES, PIPELINE_MODES
+try:
+    from satpy.resample.base import resamplers_cache as satpy_resamplers_cache
+except ImportError:
+    from satpy.resample import resamplers_cache as satpy_resamplers_cache
+
+# ========== SUN EPHEMERIS ==========
+# The de421 kernel and the timescale are loaded once per process and shared by
+# EumetSatMTG, EumetSatMSG and both executables. Set EUMETSAT_EPHEMERIS_PATH (or
+# pass ephemeris_path) to a de421.bsp file or to the folder holding it to run offline.
+
+class SunEphemeris:
+    def __init__(self, ephemeris_path=None):
+        self.ephemeris_path = ephemeris_path
+        self._lock = threading.Lock()
+        self._ts = None
+        self._eph = None
+
+    def _load(self):
+        with self._lock:
+            if self._eph is None:
+                path = self.ephemeris_path
+                if path is not None and os.path.isfile(path):
+                    loader = Loader(os.path.dirname(os.path.abspath(path)), verbose=False)
+                    eph = load_file(path)
+                else:
+                    loader = Loader(path or os.getcwd(), verbose=False)
+                    eph = loader('de421.bsp')
+                self._ts = loader.timescale(builtin=True)
+                self._eph = eph
+        return self._ts, self._eph
+
+    @property
+    def timescale(self):
+        return self._load()[0]
+
+    @property
+    def ephemeris(self):
+        return self._load()[1]
+
+    def sun_elevation(self, dt_utc, lat=39.6, lon=2.9):
+        ts, eph = self._load()
+        t = ts.utc(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute)
+        location = eph['earth'] + wgs84.latlon(latitude_degrees=lat, longitude_degrees=lon)
+        alt, _, _ = location.at(t).observe(eph['sun']).apparent().altaz()
+        return alt.degrees
+
+    def sun_elevations(self, datetimes, lat=39.6, lon=2.9):
+        # One array-valued Time instead of one scalar call per timestep
+        if len(datetimes) == 0:
+            return np.empty(0)
+        ts, eph = self._load()
+        t = ts.utc([dt.year for dt in datetimes],
+                   [dt.month for dt in datetimes],
+                   [dt.day for dt in datetimes],
+                   [dt.hour for dt in datetimes],
+                   [dt.minute for dt in datetimes])
+        location = eph['earth'] + wgs84.latlon(latitude_degrees=lat, longitude_degrees=lon)
+        alt, _, _ = location.at(t).observe(eph['sun']).apparent().altaz()
+        return np.atleast_1d(alt.degrees)
+
+    def daylight_mask(self, datetimes, min_elevation, lat=39.6, lon=2.9):
+        # lat/lon may be sequences of points: a timestep is kept when the sun is high
+        # enough over any of them. Timesteps whose time is unknown (None) are kept.
+        mask = np.ones(len(datetimes), dtype=bool)
+        known = [i for i, dt in enumerate(datetimes) if dt is not None]
+        known_datetimes = [datetimes[i] for i in known]
+        elevations = np.full(len(known), -90.0)
+        for point_lat, point_lon in zip(np.ravel(lat), np.ravel(lon)):
+            elevations = np.maximum(elevations, self.sun_elevations(known_datetimes, lat=point_lat, lon=point_lon))
+        mask[known] = elevations >= min_elevation
+        return mask
+
+
+def product_sensing_time(product):
+    try:
+        sensing_start = product.sensing_start
+    except Exception:
+        return None
+    if sensing_start is not None and sensing_start.tzinfo is not None:
+        sensing_start = sensing_start.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return sensing_start
+
+
+# ========== AREA REGISTRY ==========
+# Area definitions are built lazily, only for the region actually requested, and
+# cached per process by (name, extent, resolution) so every timestep reuses them.
+
+# Use Mercator projection for distance in meters
+_mercator_transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+_mercator_lock = threading.Lock()
+
+def compute_pixel_dimensions(area_extent, meters_per_pixel=500):
+    lon_min, lat_min, lon_max, lat_max = area_extent
+    with _mercator_lock:
+        x_min, y_min = _mercator_transformer.transform(lon_min, lat_min)
+        x_max, y_max = _mercator_transformer.transform(lon_max, lat_max)
+    width_px = int(abs(x_max - x_min) / meters_per_pixel)
+    height_px = int(abs(y_max - y_min) / meters_per_pixel)
+    return width_px, height_px
+
+_area_cache = {}
+_area_cache_lock = threading.Lock()
+
+def get_area(name, area_extent, meters_per_pixel):
+    key = (name, tuple(float(v) for v in area_extent), meters_per_pixel)
+    with _area_cache_lock:
+        if key not in _area_cache:
+            xpix, ypix = compute_pixel_dimensions(area_extent, meters_per_pixel=meters_per_pixel)
+            _area_cache[key] = create_area_def(name, {'proj': 'latlong', 'datum': 'WGS84'}, width=xpix, height=ypix, area_extent=list(area_extent))
+        return _area_cache[key]
+
+def get_region_area(region, meters_per_pixel):
+    if region not in REGION_EXTENTS:
+        raise ValueError(f"Invalid country: {region}. Choose from: {list(REGION_EXTENTS.keys())}")
+    return get_area(region, REGION_EXTENTS[region], meters_per_pixel)
+
+
+# ========== IMAGE COLOR ==========
+# Percentile stretch to uint8. The percentiles are taken on a strided subsample of
+# at most COLOR_SAMPLE_PIXELS pixels (NaN counted as 0, as in the full image), all
+# bands are scaled in one pass over (H, W * bands) rows against per-band limits tiled
+# along the row (long inner loops instead of one per pixel), in a per-thread float32
+# scratch buffer, and grayscale RGB is detected on the subsample before checking the
+# full image.
+
+COLOR_SAMPLE_PIXELS = 1 << 20
+
+_color_buffers = threading.local()
+
+def _color_scratch(shape):
+    buffer = getattr(_color_buffers, 'buffer', None)
+    size = int(np.prod(shape))
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size, dtype=np.float32)
+        _color_buffers.buffer = buffer
+    return buffer[:size].reshape(shape)
+
+def _color_sample(img, sample_pixels=COLOR_SAMPLE_PIXELS):
+    step = max(1, int(np.ceil(np.sqrt(img.shape[0] * img.shape[1] / sample_pixels))))
+    return img[::step, ::step]
+
+def _is_gray_rgb(img):
+    sample = _color_sample(img, 1 << 14)
+    if not (np.allclose(sample[..., 0], sample[..., 1]) and np.allclose(sample[..., 1], sample[..., 2])):
+        return False
+    return np.allclose(img[..., 0], img[..., 1]) and np.allclose(img[..., 1], img[..., 2])
+
+def color_limits(img, qmin=1, qmax=99):
+    # (vmin, vmax) of a (H, W) image, or per band (3,) arrays of a (H, W, 3) image
+    sample = _color_sample(img)
+    # Contiguous (bands, pixels) copy, so each band is partitioned along a contiguous axis
+    sample = np.moveaxis(sample, -1, 0).reshape(sample.shape[-1], -1) if sample.ndim == 3 else sample.reshape(1, -1)
+    sample = np.nan_to_num(np.array(sample, dtype=np.float32), nan=0.0, copy=False)
+    vmin, vmax = np.percentile(sample, (qmin, qmax), axis=1)
+    if img.ndim == 2:
+        return vmin[0], vmax[0]
+    return vmin, vmax
+
+def stretch_to_uint8(img, vmin, vmax, out=None):
+    # 255 * clip((img - vmin) / (vmax - vmin), 0, 1) truncated to uint8, NaN as 0; a band
+    # with vmax <= vmin comes out black. out may be a preallocated uint8 array.
+    vmin = np.atleast_1d(np.asarray(vmin, dtype=np.float32))
+    span = np.atleast_1d(np.asarray(vmax, dtype=np.float32)) - vmin
+    gain = np.divide(np.float32(255), span, out=np.zeros_like(span), where=span > 0)
+    nan_value = np.clip(-vmin * gain, 0, 255)
+    if out is None:
+        out = np.empty(img.shape, dtype=np.uint8)
+    height = img.shape[0]
+    rows = np.ascontiguousarray(img).reshape(height, -1)
+    if img.ndim == 3:
+        width = img.shape[1]
+        vmin, gain, nan_value = np.tile(vmin, width), np.tile(gain, width), np.tile(nan_value, width)
+    work = _color_scratch(rows.shape)
+    np.subtract(rows, vmin, out=work, casting='unsafe')
+    nan_mask = np.isnan(work) if np.any(nan_value > 0) else None
+    np.multiply(work, gain, out=work)
+    # fmax/fmin also map the NaN pixels to 0
+    np.fmax(work, 0, out=work)
+    np.fmin(work, 255, out=work)
+    if nan_mask is not None:
+        np.copyto(work, np.broadcast_to(nan_value, work.shape), where=nan_mask)
+    np.copyto(out.reshape(height, -1), work, casting='unsafe')
+    return out
+
+def handle_color(img, qmin=1, qmax=99, enhance = True, out=None):
+    if img.ndim == 3 and img.shape[-1] == 3 and _is_gray_rgb(img):
+        img = img[..., 0]
+    if not enhance:
+        return img
+    if img.ndim == 2 or (img.ndim == 3 and img.shape[-1] == 3):
+        vmin, vmax = color_limits(img, qmin, qmax)
+        return stretch_to_uint8(img, vmin, vmax, out=out)
+    return img
+
+
+# ========== RUNNING CONTRAST STRETCH ==========
+# 'frame' stretches every frame between its own quantiles, so animations flicker.
+# 'running' keeps, per (channel, region) key and band, a fixed-bin histogram of the
+# pixel values decayed exponentially from frame to frame (weight 1 - decay for the
+# new frame) and stretches between the quantiles of that histogram. Its range is set
+# by the first frame with a margin on each side; later values beyond it fall in the
+# edge bins. Each frame only costs a bincount of a small subsample.
+
+class RunningStretch:
+    def __init__(self, decay=0.9, qmin=1, qmax=99, bins=1024, margin=0.25, sample_pixels=1 << 18):
+        if not 0 <= decay < 1:
+            raise ValueError(f"Invalid stretch decay: {decay}. Must be in [0, 1)")
+        self.decay = decay
+        self.qmin = qmin
+        self.qmax = qmax
+        self.bins = bins
+        self.margin = margin
+        self.sample_pixels = sample_pixels
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _sample(self, img):
+        sample = _color_sample(img, self.sample_pixels)
+        sample = np.moveaxis(sample, -1, 0).reshape(sample.shape[-1], -1) if sample.ndim == 3 else sample.reshape(1, -1)
+        return np.nan_to_num(np.array(sample, dtype=np.float32), nan=0.0, copy=False)
+
+    def _range(self, sample):
+        lo, hi = float(sample.min()), float(sample.max())
+        span = hi - lo if hi > lo else 1.0
+        return lo - self.margin * span, hi + self.margin * span
+
+    def update(self, key, img):
+        # Adds the frame to the histogram of key and returns the (vmin, vmax) limits
+        sample = self._sample(img)
+        bands = sample.shape[0]
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or state['hist'].shape[0] != bands:
+                lo, hi = self._range(sample)
+                state = {'lo': lo, 'width': (hi - lo) / self.bins, 'hist': None}
+                self._state[key] = state
+            idx = np.clip(((sample - state['lo']) / state['width']).astype(np.int64), 0, self.bins - 1)
+            idx += (np.arange(bands) * self.bins)[:, np.newaxis]
+            hist = np.bincount(idx.ravel(), minlength=bands * self.bins).reshape(bands, self.bins) / sample.shape[1]
+            if state['hist'] is None:
+                state['hist'] = hist
+            else:
+                state['hist'] = self.decay * state['hist'] + (1 - self.decay) * hist
+            vmin, vmax = self._quantiles(state, (self.qmin, self.qmax))
+        if img.ndim == 2:
+            return vmin[0], vmax[0]
+        return vmin, vmax
+
+    def _quantiles(self, state, qs):
+        # Linear interpolation inside the bin where the cumulative histogram crosses q
+        # (every frame histogram sums to 1, and so does their decayed mix)
+        hist = state['hist']
+        cdf = np.cumsum(hist, axis=1)
+        rows = np.arange(hist.shape[0])
+        limits = []
+        for q in qs:
+            q = q / 100
+            i = np.minimum((cdf < q).sum(axis=1), self.bins - 1)
+            below = np.where(i > 0, cdf[rows, np.maximum(i - 1, 0)], 0.0)
+            inside = hist[rows, i]
+            fraction = np.divide(q - below, inside, out=np.zeros_like(inside), where=inside > 0)
+            limits.append(state['lo'] + (i + np.clip(fraction, 0, 1)) * state['width'])
+        return limits
+
+    def __call__(self, key, img, out=None):
+        if img.ndim == 3 and img.shape[-1] == 3 and _is_gray_rgb(img):
+            img = img[..., 0]
+        if img.ndim == 2 or (img.ndim == 3 and img.shape[-1] == 3):
+            vmin, vmax = self.update(key, img)
+            return stretch_to_uint8(img, vmin, vmax, out=out)
+        return img
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self._state.clear()
+            else:
+                self._state.pop(key, None)
+
+
+# ========== OUTPUT TARGETS ==========
+# A run produces one output per (channel, region) target from a single download
+# and Scene. Regions are predefined countries, or None for the custom bounding box.
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+def group_targets_by_area(targets, key='area_def'):
+    # Targets sharing an area are resampled together in one Scene.resample call
+    groups = OrderedDict()
+    for target in targets:
+        groups.setdefault(target[key], []).append(target)
+    return list(groups.items())
+
+def region_label(target, run):
+    # Predefined region name, or the bounds of a custom ROI
+    if target['region'] is not None:
+        return target['region']
+    return f"LON{run['lon_min']}S{run['lon_max']}_LAT{run['lat_min']}S{run['lat_max']}"
+
+def output_filename(satellite, target, ts_dt, run):
+    channel, region = target['channel'], target['region']
+    ts_str = ts_dt.strftime('%Y%m%dT%H%M%S')
+    if run['save_as_npy']:
+        # Single-region runs keep the historical <channel>_<timestamp>.npy names
+        if len(run['regions']) > 1:
+            return f"{channel.lower()}_{region}_{ts_str}.npy"
+        return f"{channel.lower()}_{ts_str}.npy"
+    return f"{satellite}_{channel}_{region_label(target, run)}_{ts_str}.jpg"
+
+# ========== SOLAR GEOMETRY OVER AN AREA ==========
+
+def area_sample_points(area_def, sun_sampling='center'):
+    # 'center': the middle pixel, 'corners': corners, edge midpoints and center,
+    # 'pixels': a coarse 8x8 grid of the area (per-pixel values come from solar_elevation_grid)
+    height, width = area_def.shape
+    if sun_sampling == 'center':
+        rows, cols = [height // 2], [width // 2]
+    elif sun_sampling == 'corners':
+        rows, cols = [0, height // 2, height - 1], [0, width // 2, width - 1]
+    elif sun_sampling == 'pixels':
+        rows = np.unique(np.linspace(0, height - 1, 8).astype(int))
+        cols = np.unique(np.linspace(0, width - 1, 8).astype(int))
+    else:
+        raise ValueError(f"Invalid sun_sampling: {sun_sampling}. Choose from: {list(SUN_SAMPLINGS)}")
+    lons, lats = area_def.get_lonlats(data_slice=(np.asarray(rows), np.asarray(cols)))
+    return np.ravel(lats), np.ravel(lons)
+
+def areas_sample_points(area_defs, sun_sampling='center'):
+    # Sample points of several areas together: a timestep is kept if any of them is lit
+    points = [area_sample_points(area_def, sun_sampling) for area_def in area_defs]
+    return np.concatenate([lats for lats, _ in points]), np.concatenate([lons for _, lons in points])
+
+def solar_elevation_grid(dt_utc, lats, lons):
+    # NOAA low-precision solar position (~0.1 deg), vectorized over the lat/lon arrays
+    day_of_year = dt_utc.timetuple().tm_yday
+    hours = dt_utc.hour + dt_utc.minute / 60 + dt_utc.second / 3600
+    gamma = 2 * np.pi / 365 * (day_of_year - 1 + (hours - 12) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    true_solar_minutes = hours * 60 + eqtime + 4 * np.asarray(lons, dtype=np.float32)
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    lat_rad = np.radians(np.asarray(lats, dtype=np.float32))
+    cos_zenith = np.sin(lat_rad) * np.sin(decl) + np.cos(lat_rad) * np.cos(decl) * np.cos(hour_angle)
+    return 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+
+def mask_night(img, area_def, dt_utc, min_elevation):
+    # Sets to NaN every pixel of a resampled (H, W) or (H, W, bands) image where the sun is below min_elevation
+    lons, lats = area_def.get_lonlats(dtype=np.float32)
+    night = solar_elevation_grid(dt_utc, lats, lons) < min_elevation
+    img = img.astype(np.float32, copy=False)
+    img[night] = np.nan
+    return img
+
+
+_sun_ephemerides = {}
+_sun_ephemerides_lock = threading.Lock()
+
+def get_sun_ephemeris(ephemeris_path=None):
+    ephemeris_path = ephemeris_path or os.environ.get('EUMETSAT_EPHEMERIS_PATH')
+    with _sun_ephemerides_lock:
+        if ephemeris_path not in _sun_ephemerides:
+            _sun_ephemerides[ephemeris_path] = SunEphemeris(ephemeris_path)
+        return _sun_ephemerides[ephemeris_path]
+
+
+# ========== RESAMPLER CACHE ==========
+# satpy only keeps resamplers in a weak-valued cache, so the nearest-neighbour
+# lookup of a Scene is dropped together with it and recomputed for the next
+# timestep. ResamplerCache holds strong references to them (in-memory reuse) and
+# passes cache_dir to satpy, which stores the kd-tree indices on disk keyed by the
+# source area, target area and resampler settings. satpy only keeps the indices of
+# a resampler in memory once they went through a cache_dir, so without one a
+# temporary folder of the process is used (removed when the process, or pool
+# worker, exits) and the kd-tree is still queried once per area. satpy shares one
+# resampler per key, whose neighbour info is filled in on first use, so
+# Scene.resample calls are serialized per target area (the first does the kd-tree
+# query, the next ones only build dask graphs); the resampled data is still
+# computed concurrently.
+
+_resampler_caches = {}
+_resampler_caches_lock = threading.Lock()
+_process_cache_dirs = {}
+
+
+def process_cache_dir():
+    # Temporary cache_dir of the current process; a forked worker gets its own
+    pid = os.getpid()
+    with _resampler_caches_lock:
+        if pid not in _process_cache_dirs:
+            path = tempfile.mkdtemp(prefix='eumetsat_resampler_')
+            Finalize(None, shutil.rmtree, args=(path, True), exitpriority=0)
+            _process_cache_dirs[pid] = path
+        return _process_cache_dirs[pid]
+
+
+class ResamplerCache:
+    def __init__(self, cache_dir=None, resampler='nearest', max_entries=32, **resample_kwargs):
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.resampler = resampler
+        self.max_entries = max_entries
+        self.resample_kwargs = resample_kwargs
+        self._resamplers = OrderedDict()
+        self._lock = threading.Lock()
+        self._area_locks = {}
+
+    def _area_lock(self, area_def):
+        with self._lock:
+            return self._area_locks.setdefault(area_def, threading.Lock())
+
+    def resample(self, scn, area_def, **kwargs):
+        resample_kwargs = {**self.resample_kwargs, **kwargs}
+        resample_kwargs.setdefault('cache_dir', self.cache_dir or process_cache_dir())
+        with self._area_lock(area_def):
+            scn_resampled = scn.resample(area_def, resampler=self.resampler, **resample_kwargs)
+        self._retain()
+        return scn_resampled
+
+    def _retain(self):
+        try:
+            items = list(satpy_resamplers_cache.items())
+        except RuntimeError:  # modified by another thread; picked up on the next call
+            return
+        with self._lock:
+            for key, resampler in items:
+                self._resamplers[key] = resampler
+                self._resamplers.move_to_end(key)
+            while len(self._resamplers) > self.max_entries:
+                self._resamplers.popitem(last=False)
+
+
+def get_resampler_cache(cache_dir=None):
+    cache_dir = cache_dir or os.environ.get('EUMETSAT_RESAMPLER_CACHE')
+    with _resampler_caches_lock:
+        if cache_dir not in _resampler_caches:
+            _resampler_caches[cache_dir] = ResamplerCache(cache_dir=cache_dir)
+        return _resampler_caches[cache_dir]
+
+
+
+# ========== CROP BEFORE RESAMPLE / LOW-MEMORY PROCESSING ==========
+# Resample time and peak memory come from decoding the full source disk and
+# building the resampling lookup over all of its pixels. crop_to_areas() cuts the
+# Scene down to the footprint of the target areas in the native grid first (on by
+# default). In low-memory mode dask also decodes the products in chunks sized so
+# that the chunks in flight (each alive in a few copies while it is decoded,
+# calibrated and resampled) fit the budget.
+
+LOW_MEMORY_CHUNK_COPIES = 6
+
+def low_memory_dask_config(memory_budget_mb=2048, num_workers=None):
+    num_workers = num_workers or max(1, min(4, os.cpu_count() or 1))
+    chunk_mb = int(memory_budget_mb / (num_workers * LOW_MEMORY_CHUNK_COPIES))
+    chunk_mb = max(4, min(128, chunk_mb))
+    return {'array.chunk-size': f'{chunk_mb}MiB', 'num_workers': num_workers}
+
+def crop_to_areas(scn, area_defs, margin_pixels=8, samples=64):
+    # Crops the Scene to the source-projection bounding box of the target areas
+    try:
+        src_area = scn.coarsest_area()
+        transformer = Transformer.from_crs("EPSG:4326", src_area.crs, always_xy=True)
+        xs, ys = [], []
+        for area_def in area_defs:
+            height, width = area_def.shape
+            rows = np.unique(np.linspace(0, height - 1, samples).astype(int))
+            cols = np.unique(np.linspace(0, width - 1, samples).astype(int))
+            lons, lats = area_def.get_lonlats(data_slice=(rows, cols))
+            x, y = transformer.transform(lons, lats)
+            valid = np.isfinite(x) & np.isfinite(y)
+            xs.append(x[valid])
+            ys.append(y[valid])
+        xs, ys = np.concatenate(xs), np.concatenate(ys)
+        if not xs.size:
+            return scn
+        margin = margin_pixels * max(abs(src_area.pixel_size_x), abs(src_area.pixel_size_y))
+        return scn.crop(xy_bbox=(xs.min() - margin, ys.min() - margin, xs.max() + margin, ys.max() + margin))
+    except Exception as e:
+        print(f"[WARN] Could not crop the scene before resampling ({e}). Resampling the full scene.")
+        return scn
+
+# ========== DOWNLOADS ==========
+
+def download_entry(product, entry, local_filepath, retries=3, backoff=2):
+    # Streams one product entry to disk through a .part file, retrying on failure
+    tmp_filepath = local_filepath + '.part'
+    for attempt in range(1, retries + 1):
+        try:
+            with product.open(entry=entry) as fsrc, open(tmp_filepath, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst)
+            os.replace(tmp_filepath, local_filepath)
+            return local_filepath
+        except Exception as e:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            if attempt >= retries:
+                raise
+            print(f"[WARN] Download of {os.path.basename(local_filepath)} failed ({e}). Retrying ({attempt}/{retries - 1})...")
+            time.sleep(backoff * attempt)
+
+
+
+
+# ========== PARTIAL SEVIRI NATIVE DOWNLOADS ==========
+# A SEVIRI native file is [header][one record per scan line][trailer], so a
+# sub-region only needs the header, the trailer and the records of the lines
+# covering it. download_native_subset() reads the header and trailer first,
+# builds satpy's own native file handler on them to get the source area
+# definitions, fetches the lines intersecting the target areas and writes them
+# at their offsets in a sparse file of the full size that seviri_l1b_native reads
+# as usual (the skipped lines load as missing data). If the Data Store answers a
+# range request with the whole entry (200 instead of 206), the entry is downloaded
+# in full instead; a file that does not cover the areas at all is an error.
+
+class RangeNotSupported(IOError):
+    pass
+
+class ProductRangeSource:
+    # Byte ranges of a Data Store product entry
+    def __init__(self, product, entry):
+        self.product = product
+        self.entry = entry
+
+    def read(self, start, end):
+        with self.product.open(entry=self.entry, chunk=(start, end)) as fsrc:
+            if getattr(fsrc, 'status', 206) == 200:
+                raise RangeNotSupported(f"{self.entry} was served whole instead of bytes {start}-{end}")
+            return fsrc.read()
+
+    def download(self, local_filepath, retries=3):
+        return download_entry(self.product, self.entry, local_filepath, retries)
+
+class HTTPRangeSource:
+    # Byte ranges of a file served over HTTP (mirrors, local test servers)
+    def __init__(self, url, headers=None, timeout=60):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+
+    def read(self, start, end):
+        request = urllib.request.Request(self.url, headers={**self.headers, 'Range': f'bytes={start}-{end - 1}'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = response.read()
+            if response.status != 206:  # server ignored the Range header
+                data = data[start:end]
+        return data
+
+def _read_range(source, start, end, retries=3, backoff=2):
+    for attempt in range(1, retries + 1):
+        try:
+            data = source.read(start, end)
+            if len(data) != end - start:
+                raise IOError(f"expected {end - start} bytes, got {len(data)}")
+            return data
+        except RangeNotSupported:
+            raise
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            print(f"[WARN] Range read {start}-{end} failed ({e}). Retrying ({attempt}/{retries - 1})...")
+            time.sleep(backoff * attempt)
+
+def native_lines_for_areas(handler, area_defs, margin_lines=16, samples=64):
+    # Record (scan line) range of a native file covering all the area definitions,
+    # from a grid of points of each area projected onto the file's VIS/IR and HRV grids
+    number_of_lines = int(handler.mda['number_of_lines'])
+    grids = [({'name': 'VIS006', 'resolution': 3000}, 1)]
+    if handler.mda['available_channels']['HRV']:
+        grids.append(({'name': 'HRV', 'resolution': 1000}, 3))
+    first, last = number_of_lines, 0
+    for area_def in area_defs:
+        height, width = area_def.shape
+        rows = np.unique(np.linspace(0, height - 1, samples).astype(int))
+        cols = np.unique(np.linspace(0, width - 1, samples).astype(int))
+        lons, lats = area_def.get_lonlats(data_slice=(rows, cols))
+        for dataset_id, lines_per_record in grids:
+            _, y = handler.get_area_def(dataset_id).get_array_indices_from_lonlat(lons, lats)
+            y = np.ma.compressed(y)
+            if y.size:
+                first = min(first, int(y.min()) // lines_per_record)
+                last = max(last, int(y.max()) // lines_per_record + 1)
+    if first >= last:  # the areas are not covered by this file
+        return 0, 0
+    return max(0, first - margin_lines), min(number_of_lines, last + margin_lines)
+
+def download_native_subset(source, local_filepath, area_defs, retries=3, margin_lines=16, block_size=64 * 1024 ** 2):
+    from satpy.readers.seviri_l1b_native import NativeMSGFileHandler, ASCII_STARTSWITH
+    from satpy.readers.seviri_l1b_native_hdr import get_native_header, native_trailer
+
+    tmp_filepath = local_filepath + '.part'
+    try:
+        header_type = get_native_header(_read_range(source, 0, len(ASCII_STARTSWITH), retries) == ASCII_STARTSWITH)
+        hdr_size = header_type.itemsize
+        with open(tmp_filepath, 'wb') as fdst:
+            fdst.write(_read_range(source, 0, hdr_size, retries))
+
+        # Record size and line count come from the header alone
+        sizes = NativeMSGFileHandler.__new__(NativeMSGFileHandler)
+        sizes.filename, sizes.header_type, sizes.header, sizes.mda = tmp_filepath, header_type, {}, {}
+        sizes._read_header()
+        record_size = sizes._get_data_dtype().itemsize
+        number_of_lines = int(sizes.mda['number_of_lines'])
+        trailer_offset = hdr_size + number_of_lines * record_size
+        total_size = trailer_offset + native_trailer.itemsize
+        with open(tmp_filepath, 'r+b') as fdst:
+            fdst.seek(trailer_offset)
+            fdst.write(_read_range(source, trailer_offset, total_size, retries))
+
+        handler = NativeMSGFileHandler(tmp_filepath, {}, {})
+        first, last = native_lines_for_areas(handler, area_defs, margin_lines)
+        if first >= last:
+            raise ValueError(f"{os.path.basename(local_filepath)} does not cover the target areas")
+        start, end = hdr_size + first * record_size, hdr_size + last * record_size
+        with open(tmp_filepath, 'r+b') as fdst:
+            for block_start in range(start, end, block_size):
+                block_end = min(end, block_start + block_size)
+                fdst.seek(block_start)
+                fdst.write(_read_range(source, block_start, block_end, retries))
+        os.replace(tmp_filepath, local_filepath)
+    except RangeNotSupported as e:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        print(f"[WARN] {e}. Downloading it in full.")
+        return source.download(local_filepath, retries)
+    except Exception:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+    fetched = hdr_size + (end - start) + native_trailer.itemsize
+    print(f"[INFO] Partial download: lines {first}-{last} of {number_of_lines}, {fetched / 1024 ** 2:.1f} of {total_size / 1024 ** 2:.1f} MB")
+    return local_filepath
+
+# ========== RAW PRODUCT CACHE ==========
+# Downloaded .nat/.nc files are kept in cache_dir instead of being deleted after
+# processing, so other channels or regions of the same timesteps are read from
+# disk. Files are addressed by a hash of the product id and entry name (keeping
+# the original basename, which satpy's readers match on) and the least recently
+# used ones are evicted once the cache exceeds max_bytes. Files handed out by
+# fetch() are pinned until release() so they are never evicted while in use.
+
+class ProductCache:
+    def __init__(self, cache_dir, max_bytes=20 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._pins = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith('.part'):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+
+    def path_for(self, product, entry):
+        key = hashlib.sha1(f"{product}/{entry}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key, os.path.basename(entry))
+
+    def fetch(self, product, entry, retries=3):
+        path = self.path_for(product, entry)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(path, threading.Lock())
+        with key_lock:
+            with self._lock:
+                hit = path in self._entries and os.path.exists(path)
+                self._pins[path] = self._pins.get(path, 0) + 1
+            if hit:
+                print(f"[INFO] Using cached {os.path.basename(path)}")
+                os.utime(path)
+            else:
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    download_entry(product, entry, path, retries)
+                except Exception:
+                    self._unpin(path)
+                    raise
+            with self._lock:
+                self._entries[path] = os.path.getsize(path)
+                self._entries.move_to_end(path)
+                self._evict()
+        return path
+
+    def release(self, files):
+        # Unpins the cached files and returns the ones that do not belong to the cache
+        others = []
+        for path in files:
+            if path in self._pins:
+                self._unpin(path)
+            else:
+                others.append(path)
+        with self._lock:
+            self._evict()
+        return others
+
+    def _unpin(self, path):
+        with self._lock:
+            self._pins[path] -= 1
+            if not self._pins[path]:
+                del self._pins[path]
+
+    def _evict(self):
+        total = sum(self._entries.values())
+        for path in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if path in self._pins:
+                continue
+            total -= self._entries.pop(path)
+            try:
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            except OSError as e:
+                print(f"[WARN] Could not evict {path}: {e}")
+
+
+_product_caches = {}
+_product_caches_lock = threading.Lock()
+
+def get_product_cache(cache_dir=None, max_gb=20):
+    cache_dir = cache_dir or os.environ.get('EUMETSAT_PRODUCT_CACHE')
+    if cache_dir is None:
+        return None
+    with _product_caches_lock:
+        if cache_dir not in _product_caches:
+            _product_caches[cache_dir] = ProductCache(cache_dir, max_bytes=int(max_gb * 1024 ** 3))
+        return _product_caches[cache_dir]
+
+def fetch_entry(product, entry, local_filepath, retries=3, product_cache=None):
+    # Returns the path the entry can be read from: the product cache when enabled,
+    # local_filepath otherwise
+    if product_cache is not None:
+        return product_cache.fetch(product, entry, retries)
+    return download_entry(product, entry, local_filepath, retries)
+
+# ========== DOWNLOAD / PROCESS / WRITE PIPELINE ==========
+# Runs download(item) -> process(job) -> write(result) as a staged pipeline: one
+# download thread, process_workers processing threads and the writer in the
+# calling thread, connected by bounded queues so timestep N+1 downloads while N is
+# being resampled. A stage returning None drops that item. Every item carries its
+# position in items, and the writer holds the results that arrive early until the
+# ones before them are written or dropped, so write sees the items in order (as in
+# the MSG process pool). At most 2 * queue_size + process_workers items are downloaded
+# and not yet written.
+
+def record_failure(run, ts_dt, stage, error):
+    # Timesteps that could not be downloaded, processed or written, returned by get_image
+    run['failures'].append({'time': ts_dt.strftime('%Y-%m-%dT%H:%M:%S'), 'stage': stage, 'error': str(error)})
+
+def report_failures(failures):
+    if failures:
+        print(f"[WARN] {len(failures)} failure(s): {', '.join(sorted({f['time'] for f in failures}))}")
+
+_pipeline_done = object()
+
+def run_pipeline(items, download, process, write, queue_size=2, process_workers=1):
+    download_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue()
+    in_flight = threading.Semaphore(2 * queue_size + process_workers)
+    stop = threading.Event()
+
+    def downloader():
+        try:
+            for index, item in enumerate(items):
+                in_flight.acquire()
+                if stop.is_set():
+                    break
+                try:
+                    job = download(item)
+                except Exception as e:
+                    print(f"[WARN] Download stage failed: {e}")
+                    job = None
+                if job is None:
+                    write_queue.put((index, None))
+                else:
+                    download_queue.put((index, job))
+        finally:
+            for _ in range(process_workers):
+                download_queue.put(_pipeline_done)
+
+    def processor():
+        try:
+            while True:
+                entry = download_queue.get()
+                if entry is _pipeline_done:
+                    break
+                index, job = entry
+                try:
+                    result = process(job)
+                except Exception as e:
+                    print(f"[WARN] Processing stage failed: {e}")
+                    result = None
+                write_queue.put((index, result))
+        finally:
+            write_queue.put(_pipeline_done)
+
+    threads = [threading.Thread(target=downloader, daemon=True)]
+    threads += [threading.Thread(target=processor, daemon=True) for _ in range(process_workers)]
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    held = {}
+    next_index = 0
+    try:
+        while finished < process_workers:
+            entry = write_queue.get()
+            if entry is _pipeline_done:
+                finished += 1
+                continue
+            held[entry[0]] = entry[1]
+            while next_index in held:
+                result = held.pop(next_index)
+                next_index += 1
+                in_flight.release()
+                if result is None:
+                    continue
+                try:
+                    write(result)
+                except Exception as e:
+                    print(f"[WARN] Writing stage failed: {e}")
+    finally:
+        # On an early exit (KeyboardInterrupt/SystemExit) the stage threads are daemons:
+        # stop handing them new work and let the process exit
+        stop.set()
+        in_flight.release()
+
+
+# ========== ASYNC ENGINE ==========
+# asyncio front-end behind get_images. eumdac is blocking, so the searches and downloads
+# run in one shared, bounded I/O thread pool, at most max_searches searches and
+# max_downloads downloads at a time. The products of every search are downloaded as
+# soon as it and the searches of the windows before it return, handed to
+# process_workers CPU threads and written one at a time by a single writer thread, in
+# the order of the windows and of the products in each of them (results finishing
+# early are held until the ones before them are written). At most max_downloads +
+# process_workers timesteps are downloaded and not yet written at any moment. A
+# product returned by two searches (on the boundary of two windows) is only handled
+# once, with the earlier window.
+
+async def run_async_pipeline(searches, download, process, write, max_searches=4, max_downloads=4, process_workers=1):
+    loop = asyncio.get_running_loop()
+    search_limit = asyncio.Semaphore(max_searches)
+    download_limit = asyncio.Semaphore(max_downloads)
+    in_flight = asyncio.Semaphore(max_downloads + process_workers)
+    io_pool = ThreadPoolExecutor(max_workers=max_searches + max_downloads)
+    cpu_pool = ThreadPoolExecutor(max_workers=process_workers)
+    write_pool = ThreadPoolExecutor(max_workers=1)
+    seen = set()
+    held = {}
+    next_index = 0
+    write_lock = asyncio.Lock()
+
+    async def write_in_order():
+        # Writes the held results from next_index on, until one is still missing
+        nonlocal next_index
+        async with write_lock:
+            while next_index in held:
+                job = held.pop(next_index)
+                try:
+                    if job is not None:
+                        await loop.run_in_executor(write_pool, write, job)
+                except Exception as e:
+                    print(f"[WARN] Timestep failed: {e}")
+                finally:
+                    next_index += 1
+                    in_flight.release()
+
+    async def handle(index, item):
+        job = None
+        try:
+            async with download_limit:
+                job = await loop.run_in_executor(io_pool, download, item)
+            if job is not None:
+                job = await loop.run_in_executor(cpu_pool, process, job)
+        except Exception as e:
+            print(f"[WARN] Timestep failed: {e}")
+            job = None
+        held[index] = job
+        await write_in_order()
+
+    async def limited_search(search):
+        try:
+            async with search_limit:
+                return await loop.run_in_executor(io_pool, search)
+        except Exception as e:
+            print(f"[WARN] Search failed: {e}")
+            return []
+
+    async def dispatch():
+        # Searches run concurrently; their products are numbered, and take their
+        # in_flight slot, in window order, so the next result to write always has one
+        search_tasks = [asyncio.ensure_future(limited_search(search)) for search in searches]
+        handlers = []
+        index = 0
+        try:
+            for search_task in search_tasks:
+                for item in await search_task:
+                    if str(item) in seen:
+                        continue
+                    seen.add(str(item))
+                    await in_flight.acquire()
+                    handlers.append(asyncio.ensure_future(handle(index, item)))
+                    index += 1
+            await asyncio.gather(*handlers)
+        finally:
+            for task in search_tasks + handlers:
+                task.cancel()
+
+    try:
+        await dispatch()
+    finally:
+        for pool in (io_pool, cpu_pool, write_pool):
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ========== PROCESS POOL ==========
+# Worker processes each rebuild their own area definitions and resampler cache
+# (both are per-process registries). Their dask graphs run synchronously so N
+# workers use N cores instead of each one spawning a thread per core.
+
+def init_process_worker(dask_config=None):
+    dask.config.set({'scheduler': 'synchronous', **(dask_config or {})})
+
+
+# ========== BACKFILL ==========
+# Long date ranges are processed in windows of window_hours, each one a get_image call,
+# so the product search is paged per window. After every window the checkpoint file
+# records how far the backfill got and the timesteps that failed in it. A restart
+# resumes after the last completed window, first re-running the windows that had
+# failures; the outputs they already wrote are skipped through the manifest.
+
+BACKFILL_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+def backfill_windows(start, end, window_hours=24):
+    step = datetime.timedelta(hours=window_hours)
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        yield window_start, window_end
+        window_start = window_end
+
+def _load_checkpoint(checkpoint_path, start, end, window_hours):
+    fresh = {'start': start.strftime(BACKFILL_DATE_FORMAT), 'end': end.strftime(BACKFILL_DATE_FORMAT),
+             'window_hours': window_hours, 'completed_until': None, 'failed': []}
+    if not os.path.exists(checkpoint_path):
+        return fresh
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if (checkpoint['start'], checkpoint['end']) != (fresh['start'], fresh['end']):
+        print(f"[WARN] {os.path.basename(checkpoint_path)} belongs to another date range. Starting over.")
+        return fresh
+    print(f"[INFO] Resuming backfill after {checkpoint['completed_until'] or checkpoint['start']} ({len(checkpoint['failed'])} failure(s) recorded)")
+    return checkpoint
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = checkpoint_path + '.part'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(tmp_path, checkpoint_path)
+
+def run_backfill(satellite, get_image, start_date, end_date, window_hours=24, checkpoint_path=None, retry_failed=True, **kwargs):
+    if not start_date or not end_date:
+        raise ValueError("A backfill needs both start_date and end_date.")
+    if window_hours <= 0:
+        raise ValueError(f"Invalid window_hours: {window_hours}. Must be positive")
+    start = datetime.datetime.strptime(start_date, BACKFILL_DATE_FORMAT)
+    end = datetime.datetime.strptime(end_date, BACKFILL_DATE_FORMAT)
+    kwargs['output_path'] = kwargs.get('output_path') or os.path.join(os.getcwd(), 'imgs')
+    os.makedirs(kwargs['output_path'], exist_ok=True)
+    checkpoint_path = checkpoint_path or os.path.join(kwargs['output_path'], f"backfill_{satellite}_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.json")
+    checkpoint = _load_checkpoint(checkpoint_path, start, end, window_hours)
+
+    def run_window(window_start, window_end):
+        window = [window_start.strftime(BACKFILL_DATE_FORMAT), window_end.strftime(BACKFILL_DATE_FORMAT)]
+        print(f"[INFO] Backfill window {window[0]} - {window[1]}")
+        try:
+            failures = get_image(start_date=window[0], end_date=window[1], **kwargs) or []
+        except Exception as e:
+            print(f"[WARN] Backfill window {window[0]} - {window[1]} failed: {e}")
+            failures = [{'time': window[0], 'stage': 'search', 'error': str(e)}]
+        checkpoint['failed'] = [f for f in checkpoint['failed'] if f['window'] != window] + [dict(f, window=window) for f in failures]
+
+    if retry_failed:
+        for window in sorted({tuple(f['window']) for f in checkpoint['failed']}):
+            run_window(*(datetime.datetime.strptime(t, BACKFILL_DATE_FORMAT) for t in window))
+            _save_checkpoint(checkpoint_path, checkpoint)
+
+    resume = datetime.datetime.strptime(checkpoint['completed_until'], BACKFILL_DATE_FORMAT) if checkpoint['completed_until'] else start
+    for window_start, window_end in backfill_windows(resume, end, window_hours):
+        run_window(window_start, window_end)
+        checkpoint['completed_until'] = window_end.strftime(BACKFILL_DATE_FORMAT)
+        _save_checkpoint(checkpoint_path, checkpoint)
+
+    print(f"[INFO] Backfill {checkpoint['start']} - {checkpoint['end']} complete. {len(checkpoint['failed'])} failure(s) left in {checkpoint_path}")
+    return checkpoint['failed']
+
+# ========== LIVE DAEMON ==========
+# Keeps one process warm (token, areas, resamplers, catalog) and calls get_image every
+# poll_minutes over the time elapsed since the newest sensing time found so far, so
+# each poll only searches and downloads the products published since the previous
+# one. The first poll starts at start_date, or lookback_minutes ago. The next poll
+# starts at the earliest timestep that failed (or at the same point after a failed
+# poll), which is retried (the timesteps already written are skipped) until it has
+# failed DAEMON_RETRIES polls in a row. The daemon stops once the polls have reached
+# end_date and no retry is pending, after max_polls polls or on Ctrl+C, and returns
+# the failures given up on or still pending, as get_image does.
+
+DAEMON_RETRIES = 3
+
+def run_daemon(satellite, get_image, latest_sensing_time, poll_minutes, start_date=None, end_date=None, lookback_minutes=None, max_polls=None, **kwargs):
+    if poll_minutes <= 0:
+        raise ValueError(f"Invalid poll_minutes: {poll_minutes}. Must be positive")
+    lookback = datetime.timedelta(minutes=lookback_minutes if lookback_minutes is not None else 2 * poll_minutes)
+    since = datetime.datetime.strptime(start_date, BACKFILL_DATE_FORMAT) if start_date else None
+    end = datetime.datetime.strptime(end_date, BACKFILL_DATE_FORMAT) if end_date else None
+    polls = 0
+    retries = {}  # failed timestep -> (polls in a row it failed in, last failure)
+    given_up = []
+    print(f"[INFO] {satellite} daemon polling every {poll_minutes} minute(s). Press Ctrl+C to stop.")
+    try:
+        while True:
+            poll_start = time.monotonic()
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+            window_end = min(now, end) if end is not None else now
+            window_start = since if since is not None else window_end - lookback
+            window = [window_start.strftime(BACKFILL_DATE_FORMAT), window_end.strftime(BACKFILL_DATE_FORMAT)]
+            try:
+                failures = get_image(start_date=window[0], end_date=window[1], **kwargs) or []
+                if failures:
+                    print(f"[WARN] {len(failures)} failure(s) in the poll of {window[0]} - {window[1]}")
+                # The next poll starts just after the newest product found
+                latest = latest_sensing_time()
+                if latest is not None and latest >= window_start:
+                    since = latest.replace(microsecond=0) + datetime.timedelta(seconds=1)
+            except Exception as e:
+                print(f"[WARN] {satellite} poll failed: {e}")
+                failures = [{'time': window[0], 'stage': 'search', 'error': str(e)}]
+            if since is None:
+                since = window_start
+            # unless a failed timestep is still to be retried; the ones missing from
+            # failures were all in this poll's window and succeeded
+            retries = {f['time']: (retries.get(f['time'], (0, None))[0] + 1, f) for f in failures}
+            for t in sorted(t for t, (count, _) in retries.items() if count >= DAEMON_RETRIES):
+                print(f"[WARN] Giving up on {t} after {DAEMON_RETRIES} failed polls")
+                given_up.append(retries.pop(t)[1])
+            if retries:
+                since = min(since, datetime.datetime.strptime(min(retries), BACKFILL_DATE_FORMAT))
+            polls += 1
+            if (end is not None and window_end >= end and not retries) or (max_polls is not None and polls >= max_polls):
+                break
+            time.sleep(max(0.0, poll_minutes * 60 - (time.monotonic() - poll_start)))
+    except KeyboardInterrupt:
+        print(f"[INFO] {satellite} daemon stopped.")
+    failures = given_up + [failure for _, failure in retries.values()]
+    report_failures(failures)
+    return failures
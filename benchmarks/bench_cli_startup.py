@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ========== COMMANDS ==========
+# Wall time of fresh interpreter runs from the repository root. "import <class>" is
+# what every executable call cost before the heavy imports were deferred to main().
+
+def commands(satellite):
+    executable = f"EumetSat_{satellite}_executable.py"
+    dry_run = ['--dry_run', '--start_date', '2025-08-01T00:00:00', '--end_date', '2025-08-02T00:00:00', '--country', 'iberia']
+    return [
+        ('--help', [sys.executable, executable, '--help']),
+        ('--list_channels', [sys.executable, executable, '--list_channels']),
+        ('--dry_run', [sys.executable, executable] + dry_run),
+        ('missing credentials', [sys.executable, executable, '--country', 'iberia']),
+        (f'import EumetSat_{satellite}_class', [sys.executable, '-c', f'import EumetSat_{satellite}_class'])
+    ]
+
+def best_of(cmd, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+# ========== IMPORT-TIME BREAKDOWN ==========
+# python -X importtime reports, for every module, its own and cumulative import time in
+# microseconds; the cumulative times of the modules imported directly by the class module
+# are summed per package. A package shared by several of them is counted for the first.
+
+def import_breakdown(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    # Nesting is shown by indentation and a module is listed after the ones it imports,
+    # so the direct imports (one level deep) belong to the next top-level line
+    packages = defaultdict(int)
+    pending = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            pending.append((name.strip().split('.')[0], int(cumulative)))
+        elif depth == 1:
+            if name.strip() == module:
+                total = int(cumulative)
+                for package, package_time in pending:
+                    packages[package] += package_time
+            pending = []
+    return total, sorted(packages.items(), key=lambda item: -item[1])
+
+
+# ========== MAIN ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the executables and break down the import time of the classes.")
+    parser.add_argument('--satellite', type = str, nargs = '+', choices = ['MSG', 'MTG'], default = ['MSG', 'MTG'])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--top', type = int, default = 12, help = 'Packages shown in the import-time breakdown')
+    args = parser.parse_args()
+
+    for satellite in args.satellite:
+        print(f"========== {satellite} ==========")
+        for label, cmd in commands(satellite):
+            print(f"{label:>28}: {best_of(cmd, args.repeat) * 1000:8.0f} ms")
+        # The first run warms the bytecode and file system caches
+        import_breakdown(f"EumetSat_{satellite}_class")
+        total, packages = import_breakdown(f"EumetSat_{satellite}_class")
+        print(f"Import time of EumetSat_{satellite}_class: {total / 1000:.0f} ms, of which:")
+        for name, cumulative in packages[:args.top]:
+            print(f"{name:>28}: {cumulative / 1000:8.0f} ms")
@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from EumetSat_utils import handle_color, get_region_area
+
+# ========== REFERENCE ==========
+# handle_color as it was before the subsampled, single-pass rewrite
+
+def handle_color_reference(img, qmin=1, qmax=99, enhance = True):
+    if img.ndim == 3 and img.shape[-1] == 3:
+        if np.allclose(img[...,0], img[...,1]) and np.allclose(img[...,1], img[...,2]):
+            img = img[...,0]
+    if enhance:
+        data = np.nan_to_num(img, nan=0.0)
+        if data.ndim == 2:
+            vmin, vmax = np.percentile(data, (qmin, qmax))
+            scaled = np.clip((data - vmin) / (vmax - vmin), 0, 1)
+            return (255 * scaled).astype(np.uint8)
+        elif data.ndim == 3 and data.shape[-1] == 3:
+            out = np.zeros_like(data, dtype=np.uint8)
+            for i in range(3):
+                vmin, vmax = np.percentile(data[..., i], (qmin, qmax))
+                scaled = np.clip((data[..., i] - vmin) / (vmax - vmin), 0, 1)
+                out[..., i] = (255 * scaled).astype(np.uint8)
+            return out
+    else:
+        return img
+
+
+# ========== FRAMES ==========
+# Smooth synthetic fields the size of a 500 m FCI region, with a night band of NaN
+
+def make_frame(shape, bands, rng):
+    height, width = shape
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frames = []
+    for band in range(bands):
+        field = 250 + 30 * np.sin(x / (97 + 13 * band)) * np.cos(y / (71 + 7 * band))
+        field += rng.normal(0, 4, shape).astype(np.float32)
+        frames.append(field.astype(np.float32))
+    img = np.stack(frames, axis=-1) if bands > 1 else frames[0]
+    img[:, :width // 10] = np.nan
+    return img
+
+def best_of(func, img, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(img)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+# ========== MAIN ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark handle_color against the previous implementation.")
+    parser.add_argument('--region', type = str, default = 'iberia', help = 'Region whose 500 m grid sets the frame size')
+    parser.add_argument('--resolution', type = int, default = 500, help = 'Meters per pixel')
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    shape = get_region_area(args.region, args.resolution).shape
+    rng = np.random.default_rng(0)
+    print(f"Frame: {args.region} at {args.resolution} m, {shape[1]}x{shape[0]} pixels")
+    for label, bands in (('grayscale', 1), ('RGB', 3), ('grayscale RGB', 0)):
+        img = make_frame(shape, max(bands, 1), rng)
+        if bands == 0:
+            img = np.repeat(img[..., np.newaxis], 3, axis=-1)
+        ref_time, ref = best_of(handle_color_reference, img, args.repeat)
+        new_time, new = best_of(handle_color, img, args.repeat)
+        diff = np.abs(ref.astype(np.int16) - new.astype(np.int16))
+        print(f"{label:>14}: reference {ref_time * 1000:8.1f} ms | handle_color {new_time * 1000:8.1f} ms | "
+              f"x{ref_time / new_time:5.1f} | max diff {diff.max()} | pixels differing {100 * np.mean(diff > 0):.2f}%")
@@ -0,0 +1,58 @@
+import numpy as np
+from satpy.readers.seviri_l1b_native import NativeMSGFileHandler
+from satpy.readers.seviri_l1b_native_hdr import get_native_header, native_trailer
+
+
+# ========== SYNTHETIC NATIVE FILE ==========
+# A rapid-scan SEVIRI native file (northern third of the disk) with the VIS006 and
+# IR_108 channels and random counts, built from satpy's own header and trailer types.
+
+def _header_value(value):
+    return str(value).encode()
+
+
+def write_native_fixture(path):
+    header = np.zeros(1, dtype=get_native_header(True))
+    main = header['15_MAIN_PRODUCT_HEADER']
+    main['FormatName']['Name'] = b'FormatName'.ljust(28) + b': '
+    main['FormatName']['Value'] = b'NATIVE'
+    main['QQOV']['Value'] = b'OK'
+    secondary = header['15_SECONDARY_PRODUCT_HEADER']
+    for key, value in dict(SelectedBandIDs='X' + '-' * 7 + 'X' + '-' * 3,  # VIS006, IR_108
+                           SouthLineSelectedRectangle=2321, NorthLineSelectedRectangle=3712,
+                           EastColumnSelectedRectangle=1, WestColumnSelectedRectangle=3712,
+                           NumberLinesVISIR=1392, NumberColumnsVISIR=3712,
+                           NumberLinesHRV=4176, NumberColumnsHRV=11136).items():
+        secondary[key]['Value'] = _header_value(value)
+    data_header = header['15_DATA_HEADER']
+    data_header['SatelliteStatus']['SatelliteDefinition']['SatelliteId'] = 323
+    earth = data_header['GeometricProcessing']['EarthModel']
+    earth['TypeOfEarthModel'] = 2
+    earth['EquatorialRadius'] = 6378.169
+    earth['NorthPolarRadius'] = 6356.5838
+    earth['SouthPolarRadius'] = 6356.5838
+    description = data_header['ImageDescription']
+    description['ProjectionDescription']['LongitudeOfSSP'] = 9.5
+    for grid, step in (('ReferenceGridVIS_IR', 3.0004032), ('ReferenceGridHRV', 1.0001343)):
+        description[grid]['LineDirGridStep'] = step
+        description[grid]['ColumnDirGridStep'] = step
+        description[grid]['GridOrigin'] = 2
+    description['Level15ImageProduction']['PlannedChanProcessing'] = 1
+    calibration = data_header['RadiometricProcessing']['Level15ImageCalibration']
+    calibration['CalSlope'] = 0.01
+    calibration['CalOffset'] = -0.5
+    with open(path, 'wb') as f:
+        f.write(header.tobytes())
+
+    # The record layout follows from the header
+    sizes = NativeMSGFileHandler.__new__(NativeMSGFileHandler)
+    sizes.filename, sizes.header_type, sizes.header, sizes.mda = path, header.dtype, {}, {}
+    sizes._read_header()
+    records = int(sizes.mda['number_of_lines']) * sizes._get_data_dtype().itemsize
+
+    trailer = np.zeros(1, dtype=native_trailer)
+    trailer['15TRAILER']['ImageProductionStats']['ActualScanningSummary']['ReducedScan'] = 1
+    with open(path, 'ab') as f:
+        f.write(np.random.default_rng(0).integers(1, 255, size=records, dtype=np.uint8).tobytes())
+        f.write(trailer.tobytes())
+    return path
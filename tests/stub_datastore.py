@@ -0,0 +1,86 @@
+import contextlib
+import datetime
+import io
+import threading
+import time
+
+# ========== STUB DATA STORE ==========
+# Stand-in for eumdac's DataStore, passed to EumetSatMSG(datastore=...): every product
+# of the collection serves the same local native file as its .nat entry. Searches and
+# downloads can be slowed down, and both record how many ran at the same time.
+
+
+class ConcurrencyCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.active += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.active)
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.active -= 1
+
+
+class StubProduct:
+    def __init__(self, datastore, sensing_start):
+        self.datastore = datastore
+        self.sensing_start = sensing_start
+        self.sensing_end = sensing_start + datetime.timedelta(minutes=5)
+        self._id = f"MSG3-SEVI-MSG15-0100-NA-{sensing_start:%Y%m%d%H%M%S}.000000000Z-NA"
+        self.entries = (self._id + '.nat', 'manifest.xml')
+
+    def __str__(self):
+        return self._id
+
+    @contextlib.contextmanager
+    def open(self, entry=None, chunk=None):
+        with self.datastore.downloads:
+            self.datastore.downloaded.append(self._id)
+            time.sleep(self.datastore.download_delay)
+            with open(self.datastore.native_path, 'rb') as f:
+                data = f.read()
+            yield io.BytesIO(data if chunk is None else data[chunk[0]:chunk[1]])
+
+
+class StubCollection:
+    def __init__(self, datastore, collection_id):
+        self.datastore = datastore
+        self._id = collection_id
+
+    def __str__(self):
+        return self._id
+
+    def search(self, dtstart=None, dtend=None, **kwargs):
+        # Both ends inclusive and most recent first, as the Data Store answers
+        with self.datastore.searches:
+            time.sleep(self.datastore.search_delay)
+            return [StubProduct(self.datastore, t) for t in sorted(self.datastore.times, reverse=True)
+                    if (dtstart is None or t >= dtstart) and (dtend is None or t <= dtend)]
+
+
+class StubDataStore:
+    def __init__(self, times, native_path, search_delay=0.0, download_delay=0.0):
+        self.times = list(times)
+        self.native_path = native_path
+        self.search_delay = search_delay
+        self.download_delay = download_delay
+        self.searches = ConcurrencyCounter()
+        self.downloads = ConcurrencyCounter()
+        self.downloaded = []
+
+    def get_collection(self, collection_id):
+        return StubCollection(self, collection_id)
+
+    def get_product(self, collection_id, product_id):
+        for t in self.times:
+            if str(StubProduct(self, t)) == product_id:
+                return StubProduct(self, t)
+        raise KeyError(product_id)
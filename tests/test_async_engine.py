@@ -0,0 +1,96 @@
+import asyncio
+import datetime
+import glob
+import os
+import threading
+import time
+import warnings
+import pytest
+from EumetSat_utils import run_async_pipeline
+from native_fixture import write_native_fixture
+from stub_datastore import ConcurrencyCounter, StubDataStore
+
+warnings.filterwarnings('ignore')
+
+
+# ========== ENGINE ==========
+
+def test_async_pipeline_limits_dedup_and_order():
+    # Six windows of five items, each sharing its last item with the next window
+    windows = [list(range(4 * w, 4 * w + 5)) for w in range(6)]
+    searches, downloads, processing = ConcurrencyCounter(), ConcurrencyCounter(), ConcurrencyCounter()
+    in_flight = {'now': 0, 'peak': 0}
+    lock = threading.Lock()
+    written = []
+
+    def make_search(items):
+        def search():
+            with searches:
+                time.sleep(0.05)
+                return list(reversed(items))
+        return search
+
+    def download(item):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+        with downloads:
+            time.sleep(0.01 * (item % 3))
+        return item
+
+    def process(item):
+        with processing:
+            time.sleep(0.01 * ((item + 1) % 4))
+        if item == 7:
+            with lock:
+                in_flight['now'] -= 1
+            return None
+        return item
+
+    def write(item):
+        written.append(item)
+        with lock:
+            in_flight['now'] -= 1
+
+    asyncio.run(run_async_pipeline([make_search(items) for items in windows], download, process, write,
+                                   max_searches=3, max_downloads=2, process_workers=2))
+
+    assert searches.calls == 6 and searches.peak == 3
+    assert downloads.peak == 2
+    assert processing.peak <= 2
+    # Every boundary item is downloaded once; the dropped item is not written
+    assert downloads.calls == 25
+    assert in_flight['peak'] <= 2 + 2
+    # Written in window order, newest-first search results kept as returned
+    expected = []
+    for items in windows:
+        expected += [item for item in reversed(items) if item not in expected]
+    assert written == [item for item in expected if item != 7]
+
+
+# ========== EumetSatMSG.get_images ==========
+
+@pytest.fixture(scope='module')
+def native_file(tmp_path_factory):
+    return write_native_fixture(str(tmp_path_factory.mktemp('native') / 'source.nat'))
+
+
+def test_get_images_with_stub_datastore(native_file, tmp_path):
+    from EumetSat_MSG_class import EumetSatMSG
+    times = [datetime.datetime(2025, 8, 1, 12, 0) + datetime.timedelta(minutes=5 * i) for i in range(4)]
+    datastore = StubDataStore(times, native_file, search_delay=0.2, download_delay=0.1)
+    processor = EumetSatMSG(datastore=datastore)
+
+    # 5-minute windows: the products at 12:05 and 12:10 are returned by two searches
+    failures = asyncio.run(processor.get_images('2025-08-01T12:00:00', '2025-08-01T12:15:00', window_hours=5 / 60,
+                                                max_searches=3, max_downloads=2, process_workers=2,
+                                                output_path=str(tmp_path), output_format='npy', channel='IR_108',
+                                                country='balearic_islands', skip_night_angle=None))
+
+    assert failures == []
+    assert datastore.searches.calls == 3 and datastore.searches.peak == 3
+    assert 1 <= datastore.downloads.peak <= 2
+    assert sorted(datastore.downloaded) == sorted(set(datastore.downloaded))
+    assert len(datastore.downloaded) == 4
+    assert len(glob.glob(os.path.join(str(tmp_path), '*.npy'))) == 4
+    assert processor.latest_sensing_time == times[-1]
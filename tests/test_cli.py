@@ -0,0 +1,29 @@
+import pytest
+import EumetSat_MSG_executable
+import EumetSat_MTG_executable
+
+DATES = ['--start_date', '2025-08-01T00:00:00', '--end_date', '2025-08-02T00:00:00']
+
+
+@pytest.mark.parametrize('executable', [EumetSat_MSG_executable, EumetSat_MTG_executable])
+@pytest.mark.parametrize('argv, message', [
+    (['--channel', 'XX', '--dry_run'], 'Invalid channel'),
+    (['--country', 'mars', '--dry_run'], 'Invalid country'),
+    (['--country', 'france', '--lat_min', '40', '--lat_max', '45', '--lon_min', '0', '--lon_max', '5', '--dry_run'], 'Mixture'),
+    (['--start_date', '2025-08-01', '--dry_run'], 'Invalid start_date'),
+    (['--start_date', '2025-08-02T00:00:00', '--end_date', '2025-08-01T00:00:00', '--dry_run'], 'must be before'),
+    (DATES + ['--window_hours', '0', '--dry_run'], 'Invalid window_hours'),
+    (['--country', 'iberia'], '--consumer_key'),
+    (['--country', 'iberia', '--consumer_key', 'key'], '--consumer_secret'),
+])
+def test_invalid_arguments_are_usage_errors(executable, argv, message, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        executable.main(argv)
+    assert exit_info.value.code == 2
+    assert message in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('executable', [EumetSat_MSG_executable, EumetSat_MTG_executable])
+def test_dry_run_with_custom_bounding_box(executable, capsys):
+    executable.main(DATES + ['--lat_min', '40', '--lat_max', '45', '--lon_min', '0', '--lon_max', '5', '--dry_run'])
+    assert 'custom_area' in capsys.readouterr().out
@@ -0,0 +1,49 @@
+import datetime
+import EumetSat_utils
+from EumetSat_utils import BACKFILL_DATE_FORMAT, DAEMON_RETRIES, run_daemon
+
+TIMES = [datetime.datetime(2025, 8, 1, 12, 0) + datetime.timedelta(minutes=5 * i) for i in range(6)]
+
+
+class FakeGetImage:
+    # get_image over TIMES: 12:05 fails in the first two polls covering it, 12:10 always
+    def __init__(self):
+        self.latest = None
+        self.attempts = {}
+        self.windows = []
+
+    def __call__(self, start_date, end_date, **kwargs):
+        self.windows.append(start_date)
+        start = datetime.datetime.strptime(start_date, BACKFILL_DATE_FORMAT)
+        end = datetime.datetime.strptime(end_date, BACKFILL_DATE_FORMAT)
+        failures = []
+        for t in TIMES:
+            if not start <= t <= end:
+                continue
+            key = t.strftime(BACKFILL_DATE_FORMAT)
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            self.latest = t
+            if t.minute == 10 or (t.minute == 5 and self.attempts[key] <= 2):
+                failures.append({'time': key, 'stage': 'download', 'error': 'unavailable'})
+        return failures
+
+
+def test_daemon_retries_failed_timesteps_past_end_date(monkeypatch):
+    monkeypatch.setattr(EumetSat_utils.time, 'sleep', lambda seconds: None)
+    get_image = FakeGetImage()
+    failures = run_daemon('MSG', get_image, lambda: get_image.latest, 5,
+                          start_date='2025-08-01T12:00:00', end_date='2025-08-01T12:30:00')
+
+    assert get_image.windows == ['2025-08-01T12:00:00', '2025-08-01T12:05:00', '2025-08-01T12:05:00']
+    assert get_image.attempts['2025-08-01T12:05:00'] == 3
+    assert get_image.attempts['2025-08-01T12:10:00'] == DAEMON_RETRIES
+    assert [f['time'] for f in failures] == ['2025-08-01T12:10:00']
+
+
+def test_daemon_returns_pending_retries_at_max_polls(monkeypatch):
+    monkeypatch.setattr(EumetSat_utils.time, 'sleep', lambda seconds: None)
+    get_image = FakeGetImage()
+    failures = run_daemon('MSG', get_image, lambda: get_image.latest, 5,
+                          start_date='2025-08-01T12:00:00', end_date='2025-08-01T12:30:00', max_polls=1)
+
+    assert sorted(f['time'] for f in failures) == ['2025-08-01T12:05:00', '2025-08-01T12:10:00']
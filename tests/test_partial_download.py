@@ -0,0 +1,119 @@
+import os
+import threading
+import urllib.request
+import warnings
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pytest
+from pyresample import geometry
+from satpy import Scene
+from EumetSat_utils import HTTPRangeSource, ProductRangeSource, download_native_subset, get_region_area
+from native_fixture import write_native_fixture
+
+warnings.filterwarnings('ignore')
+
+NATIVE_NAME = 'MSG3-SEVI-MSG15-0100-NA-20250801120000.000000000Z-NA.nat'
+
+
+# ========== RANGE SERVER ==========
+# Serves the fixture folder; /<name> honours Range headers (206), /whole/<name> ignores
+# them and always answers 200 with the whole file.
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    served = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        whole = self.path.startswith('/whole/')
+        path = self.translate_path(self.path[len('/whole'):] if whole else self.path)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        if self.headers.get('Range') and not whole:
+            start, end = map(int, self.headers['Range'].split('=')[1].split('-'))
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.served.append(len(data))
+        if whole or not self.headers.get('Range'):
+            self.send_response(200)
+        else:
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class HTTPProduct:
+    # Stand-in for an eumdac Product whose entries are served by RangeHandler
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def open(self, entry=None, chunk=None):
+        headers = {'Range': f'bytes={chunk[0]}-{chunk[1] - 1}'} if chunk else {}
+        return urllib.request.urlopen(urllib.request.Request(f'{self.base_url}/{entry}', headers=headers))
+
+
+@pytest.fixture(scope='module')
+def native_file(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('full')
+    return write_native_fixture(str(folder / NATIVE_NAME))
+
+
+@pytest.fixture(scope='module')
+def server(native_file):
+    directory = os.path.dirname(native_file)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), lambda *args, **kwargs: RangeHandler(*args, directory=directory, **kwargs))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+
+
+def resample_ir(path, area_def):
+    scn = Scene(filenames=[path], reader='seviri_l1b_native')
+    scn.load(['IR_108'], calibration='counts')
+    return scn.resample(area_def, resampler='nearest')['IR_108'].values
+
+
+# ========== TESTS ==========
+
+@pytest.mark.parametrize('region', ['balearic_islands', 'france'])
+def test_partial_download_resamples_like_full_file(native_file, server, tmp_path, region):
+    area_def = get_region_area(region, 3000)
+    local_filepath = str(tmp_path / NATIVE_NAME)
+    RangeHandler.served.clear()
+    download_native_subset(HTTPRangeSource(f'{server}/{NATIVE_NAME}'), local_filepath, [area_def])
+
+    assert os.path.getsize(local_filepath) == os.path.getsize(native_file)
+    assert sum(RangeHandler.served) < os.path.getsize(native_file) / 2
+    full = resample_ir(native_file, area_def)
+    partial = resample_ir(local_filepath, area_def)
+    assert np.isfinite(full).any()
+    np.testing.assert_array_equal(full, partial)
+
+
+def test_uncovered_areas_raise(server, tmp_path):
+    # The rapid-scan file stops well north of the southern hemisphere
+    area_def = geometry.AreaDefinition('south', 'south', 'south', 'EPSG:4326', 50, 50, (15.0, -35.0, 20.0, -30.0))
+    local_filepath = str(tmp_path / NATIVE_NAME)
+    with pytest.raises(ValueError, match='does not cover'):
+        download_native_subset(HTTPRangeSource(f'{server}/{NATIVE_NAME}'), local_filepath, [area_def])
+    assert os.listdir(tmp_path) == []
+
+
+def test_entry_served_whole_falls_back_to_full_download(native_file, server, tmp_path):
+    local_filepath = str(tmp_path / NATIVE_NAME)
+    source = ProductRangeSource(HTTPProduct(f'{server}/whole'), NATIVE_NAME)
+    download_native_subset(source, local_filepath, [get_region_area('balearic_islands', 3000)], retries=1)
+    with open(local_filepath, 'rb') as local, open(native_file, 'rb') as full:
+        assert local.read() == full.read()
+    assert not os.path.exists(local_filepath + '.part')
+
+
+def test_product_range_source_reads_ranges(native_file, server):
+    source = ProductRangeSource(HTTPProduct(server), NATIVE_NAME)
+    with open(native_file, 'rb') as f:
+        f.seek(1000)
+        assert source.read(1000, 1500) == f.read(500)
@@ -0,0 +1,63 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import eumdac.request as eumdac_request
+from eumdac.token import URLs
+import EumetSat_session as session
+
+
+# ========== TOKEN SERVER ==========
+# Answers every token request with the same token, valid for expires_in seconds, as the
+# Data Store does until a token actually expires.
+
+class TokenHandler(BaseHTTPRequestHandler):
+    requests = 0
+    expires_in = 100
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        TokenHandler.requests += 1
+        body = json.dumps({'access_token': 'same-token', 'expires_in': TokenHandler.expires_in}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def token():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), TokenHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    urls = URLs()
+    urls.set('token', 'token', f'http://127.0.0.1:{httpd.server_address[1]}/token')
+    TokenHandler.requests = 0
+    yield session.SharedAccessToken(('key', 'secret'), urls=urls)
+    httpd.shutdown()
+
+
+def test_unchanged_token_renewal_is_rate_limited(token):
+    # Expiring within the refresh margin: renewed once, then not before the interval
+    for _ in range(20):
+        assert token.access_token == 'same-token'
+    assert TokenHandler.requests == 1
+    token._last_renewal -= session.TOKEN_RENEWAL_INTERVAL
+    assert token.access_token == 'same-token'
+    assert TokenHandler.requests == 2
+
+
+def test_expired_or_invalidated_token_is_renewed_at_once(token):
+    assert token.access_token == 'same-token'
+    token.invalidate('same-token')
+    assert token.access_token == 'same-token'
+    assert TokenHandler.requests == 2
+
+
+def test_pooled_requests_need_eumdac_private_api(monkeypatch):
+    original = eumdac_request._request
+    monkeypatch.delattr(eumdac_request, '_should_retry')
+    assert session.install_pooled_requests() is False
+    assert eumdac_request._request is original